@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class ShopConfig(AppConfig):
     name = 'shop'
+
+    def ready(self):
+        from . import checks, registry, signals
+        registry.build()
+        signals.connect_catalog_models(
+        info.model for info in registry.models.values()
+        if not info.model._meta.auto_created
+        )
@@ -0,0 +1,51 @@
+"""
+JWT authentication without a user query on every API call.
+
+Users are cached by the id in the token for SHOP_AUTH_CACHE_TIMEOUT
+seconds. Saving or deleting a user drops the entry, so deactivation
+takes effect right away. Queryset updates skip the signals, for them the
+short timeout bounds how long the old user is served.
+
+With SHOP_AUTH_STATELESS the user is built from the token claims
+(see UserTokenObtainPairSerializer) without touching the database. A
+deactivated user then keeps access until the access token expires.
+"""
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import backend
+
+
+def user_key(user_id):
+    return 'shop:auth:user:%s' % user_id
+
+
+def forget(user):
+    backend().delete(user_key(getattr(user, api_settings.USER_ID_FIELD)))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        if getattr(settings, 'SHOP_AUTH_STATELESS', False):
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+
+        timeout = getattr(settings, 'SHOP_AUTH_CACHE_TIMEOUT', 60)
+        if not timeout:
+            return super().get_user(validated_token)
+        cache = backend()
+        key = user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            # raises for missing and inactive users, those are not cached
+            user = super().get_user(validated_token)
+            cache.set(key, user, timeout)
+        return user
@@ -0,0 +1,192 @@
+"""
+Synthetic catalog data and timing helpers for the benchmark command.
+
+generate() yields records in the shape of test_data.json, model by model
+in import order, so any number of products can be streamed to a file or
+straight into the importer. Every product gets its attributes and images
+from its own seeded random generator, the output of a seed is stable.
+"""
+import random
+import statistics
+import time
+
+
+NAMES = [
+('Barva', 'color'), ('Odolnost', 'durability'), ('Povrch', 'surface'),
+('Material', 'material'), ('Velikost', 'size'), ('Urceni', 'target'),
+('Zeme puvodu', 'origin'), ('Zaruka', 'warranty'), ('Hmotnost', 'weight'),
+('Skladem', 'stock'), ('Sleva', 'sale'), ('Znacka', 'brand'),
+]
+WORDS = [
+'lednicka', 'boty', 'hodinky', 'brusle', 'figurka', 'bunda', 'kolo',
+'telefon', 'batoh', 'lampa', 'stul', 'zidle', 'kabel', 'hrnek', 'kniha',
+'cerna', 'bila', 'modra', 'zelena', 'damske', 'panske', 'detske', 'classic',
+'sport', 'premium', 'mini', 'max', 'pro', 'lite', 'eco',
+]
+VALUES_PER_NAME = 40
+MAX_IMAGES = 4
+CATALOG_SIZE = 1000
+
+
+class SyntheticCatalog:
+    """
+    Ids and fan-out of a synthetic catalog of `products` products.
+    """
+
+    def __init__(self, products, seed=1, attributes=(3, 8), images=(1, MAX_IMAGES)):
+        self.products = products
+        self.seed = seed
+        self.attributes = attributes
+        self.images = images
+        self.names = len(NAMES)
+        self.catalogs = max(1, (products + CATALOG_SIZE - 1) // CATALOG_SIZE)
+
+
+    def rng(self, pk):
+        return random.Random(self.seed * 1000003 + pk)
+
+
+    def attribute_id(self, name, value):
+        return name * VALUES_PER_NAME + value + 1
+
+
+    def product_attributes(self, pk):
+        """
+        Attribute ids of a product, at most one value per name.
+        """
+        rng = self.rng(pk)
+        count = rng.randint(*self.attributes)
+        names = rng.sample(range(self.names), min(count, self.names))
+        # a few values are much more common, like real colours and sizes
+        return [
+        self.attribute_id(name, min(int(rng.expovariate(0.15)), VALUES_PER_NAME - 1))
+        for name in names
+        ]
+
+
+    def image_count(self, pk):
+        return self.rng(-pk).randint(*self.images)
+
+
+    def image_id(self, pk, index):
+        return (pk - 1) * MAX_IMAGES + index + 1
+
+
+    def records(self):
+        for name, (label, code) in enumerate(NAMES, 1):
+            yield {'AttributeName': {
+            'id': name, 'nazev': label, 'kod': code, 'zobrazit': name % 3 != 0
+            }}
+        for name in range(self.names):
+            for value in range(VALUES_PER_NAME):
+                pk = self.attribute_id(name, value)
+                yield {'AttributeValue': {
+                'id': pk, 'hodnota': '%s %s' % (NAMES[name][0].lower(), value)
+                }}
+
+        for pk in range(1, self.products + 1):
+            for index in range(self.image_count(pk)):
+                image = self.image_id(pk, index)
+                yield {'Image': {
+                'id': image,
+                'obrazek': 'https://img.example.com/%s/%s.jpg' % (pk, image)
+                }}
+        for catalog in range(1, self.catalogs + 1):
+            yield {'Image': {
+            'id': self.products * MAX_IMAGES + catalog,
+            'obrazek': 'https://img.example.com/catalog/%s.jpg' % catalog
+            }}
+
+        for name in range(self.names):
+            for value in range(VALUES_PER_NAME):
+                pk = self.attribute_id(name, value)
+                yield {'Attribute': {
+                'id': pk, 'nazev_atributu_id': name + 1, 'hodnota_atributu_id': pk
+                }}
+
+        for pk in range(1, self.products + 1):
+            yield {'Product': self.product(pk)}
+
+        link = 0
+        for pk in range(1, self.products + 1):
+            for attribute in self.product_attributes(pk):
+                link += 1
+                yield {'ProductAttributes': {
+                'id': link, 'attribute': attribute, 'product': pk
+                }}
+
+        for pk in range(1, self.products + 1):
+            for index in range(self.image_count(pk)):
+                image = self.image_id(pk, index)
+                yield {'ProductImage': {
+                'id': image, 'product': pk, 'obrazek_id': image,
+                'nazev': 'hlavni foto' if index == 0 else 'galerie'
+                }}
+
+        for catalog in range(1, self.catalogs + 1):
+            first = (catalog - 1) * CATALOG_SIZE + 1
+            last = min(catalog * CATALOG_SIZE, self.products)
+            rng = self.rng(-self.products - catalog)
+            yield {'Catalog': {
+            'id': catalog,
+            'nazev': 'Katalog %s' % catalog,
+            'obrazek_id': self.products * MAX_IMAGES + catalog,
+            'products_ids': list(range(first, last + 1)),
+            'attributes_ids': sorted(
+            rng.sample(range(1, self.names * VALUES_PER_NAME + 1), 4)
+            ),
+            }}
+
+
+    def product(self, pk):
+        rng = self.rng(pk + self.products)
+        words = rng.sample(WORDS, 3)
+        published = rng.random() < 0.7
+        return {
+        'id': pk,
+        'nazev': '%s %s' % (' '.join(words).capitalize(), pk),
+        'description': ' '.join(rng.choice(WORDS) for i in range(rng.randint(10, 40))),
+        'cena': (
+        '%s' % rng.randint(50, 50000) if rng.random() < 0.5
+        else '%.2f' % rng.uniform(2, 2000)
+        ),
+        'mena': 'CZK' if rng.random() < 0.8 else 'EUR',
+        'published_on': (
+        '20%02d-%02d-%02dT00:00:00Z' % (
+        rng.randint(15, 24), rng.randint(1, 12), rng.randint(1, 28)
+        ) if published else None
+        ),
+        'is_published': published,
+        }
+
+
+def generate(products, seed=1):
+    return SyntheticCatalog(products, seed).records()
+
+
+def timed(func, repeat):
+    """
+    Run `func` `repeat` times, returns timings in milliseconds.
+    """
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def percentile(timings, share):
+    return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+    'runs': len(timings),
+    'median_ms': round(statistics.median(timings), 3),
+    'p95_ms': round(percentile(timings, 0.95), 3),
+    'p99_ms': round(percentile(timings, 0.99), 3),
+    'min_ms': round(timings[0], 3),
+    'max_ms': round(timings[-1], 3),
+    }
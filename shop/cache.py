@@ -0,0 +1,210 @@
+"""
+Response cache and conditional GET for the catalog read views.
+
+Every model has a version number in the cache, keys of cached responses
+and ETags contain the versions of the models the view reads. Imports and
+saves bump the version, so old entries are never served again and simply
+expire.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import routers
+
+
+HITS_KEY = 'shop:cache:hits'
+MISSES_KEY = 'shop:cache:misses'
+
+_response = threading.local()
+
+
+def backend():
+    return caches[getattr(settings, 'SHOP_CACHE_ALIAS', 'default')]
+
+
+def version_key(model):
+    return 'shop:version:%s' % model
+
+
+def changed_key(model):
+    return 'shop:changed:%s' % model
+
+
+def model_versions(models):
+    """
+    Current versions of the models, missing ones start from a timestamp
+    so they never repeat a version used before the cache lost them.
+    """
+    cache = backend()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for model, key in zip(models, keys):
+        if key not in versions:
+            now = time.time()
+            cache.add(changed_key(model), now, None)
+            cache.add(key, int(now * 1000), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def last_changed(models):
+    """
+    Time of the latest change of any of the models.
+    """
+    cache = backend()
+    changed = cache.get_many([changed_key(model) for model in models])
+    if len(changed) < len(models):
+        model_versions(models)
+        changed = cache.get_many([changed_key(model) for model in models])
+    return max(changed.values(), default=None)
+
+
+def bump_versions(models):
+    cache = backend()
+    now = time.time()
+    for model in models:
+        cache.set(changed_key(model), now, None)
+        try:
+            cache.incr(version_key(model))
+        except ValueError:
+            model_versions([model])
+
+
+def served_stale():
+    """
+    Called by code answering from data older than the model versions, e.g.
+    a facet index still being rebuilt. The response built by this thread
+    then gets no ETag and is not cached.
+    """
+    _response.stale = True
+
+
+def count(key):
+    cache = backend()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    values = backend().get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+    'hits': hits,
+    'misses': misses,
+    'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+class VersionedViewMixin:
+    """
+    View whose output only depends on the request and on `cache_models`.
+    """
+    cache_models = []
+
+    def get_cache_models(self, request, **kwargs):
+        return self.cache_models
+
+    def response_digest(self, request, **kwargs):
+        if getattr(request, '_shop_digest', None) is None:
+            models = sorted(self.get_cache_models(request, **kwargs))
+            parts = [
+            type(self).__name__,
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            str(request.user.pk if request.user.is_authenticated else ''),
+            ]
+            parts += [
+            '%s=%s' % pair for pair in zip(models, model_versions(models))
+            ]
+            request._shop_digest = hashlib.md5(
+            '|'.join(parts).encode('utf-8')
+            ).hexdigest()
+        return request._shop_digest
+
+    def maybe_stale(self, request, **kwargs):
+        """
+        A replica may lag behind the latest change, a response read from
+        one shortly after it must not be stored under the new versions.
+        """
+        if getattr(_response, 'stale', False):
+            return True
+        if not routers.reading_replica():
+            return False
+        changed = last_changed(sorted(self.get_cache_models(request, **kwargs)))
+        window = getattr(settings, 'SHOP_DB_STICKY_SECONDS', 10)
+        return changed is not None and time.time() - changed < window
+
+
+class ConditionalGetMixin(VersionedViewMixin):
+    """
+    Strong ETag and Last-Modified from the model versions, a matching
+    If-None-Match or If-Modified-Since gets 304 before the view runs.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super().dispatch(request, *args, **kwargs)
+
+        etag = '"%s"' % self.response_digest(request, **kwargs)
+        changed = last_changed(sorted(self.get_cache_models(request, **kwargs)))
+        last_modified = int(changed) if changed is not None else None
+        response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            return response
+
+        _response.stale = False
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not self.maybe_stale(request, **kwargs):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class CachedResponseMixin(VersionedViewMixin):
+    """
+    Cache GET responses of a view until one of `cache_models` changes.
+    """
+
+    def response_cache_key(self, request, **kwargs):
+        return 'shop:view:%s' % self.response_digest(request, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        if (request.method != 'GET'
+        or not getattr(settings, 'SHOP_VIEW_CACHE', True)):
+            return super().dispatch(request, *args, **kwargs)
+
+        cache = backend()
+        key = self.response_cache_key(request, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            count(HITS_KEY)
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        count(MISSES_KEY)
+        _response.stale = False
+        response = super().dispatch(request, *args, **kwargs)
+        if (response.status_code == 200 and not response.streaming
+        and not self.maybe_stale(request, **kwargs)):
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            cache.set(
+            key, (response.content, response['Content-Type']),
+            getattr(settings, 'SHOP_VIEW_CACHE_TIMEOUT', 3600)
+            )
+        return response
@@ -0,0 +1,32 @@
+"""
+System checks of the shop settings.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+@register()
+def shared_cache(app_configs, **kwargs):
+    """
+    Cached pages, currency rates, users and model versions are invalidated
+    in the cache, a worker with a cache of its own never sees it.
+    """
+    if getattr(settings, 'SHOP_WORKERS', 1) <= 1:
+        return []
+    aliases = {'default', getattr(settings, 'SHOP_CACHE_ALIAS', 'default')}
+    return [
+    Warning(
+    'Cache %r is local to one process, but SHOP_WORKERS is %s.' % (
+    alias, settings.SHOP_WORKERS
+    ),
+    hint='Use a cache shared by the workers, e.g. FileBasedCache or Redis.',
+    id='shop.W001',
+    )
+    for alias in sorted(aliases)
+    if settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+    ]
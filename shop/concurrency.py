@@ -0,0 +1,135 @@
+"""
+Async read views for the ASGI entry point.
+
+Django 3.1 has no async ORM and runs sync views under ASGI one at a time
+in a single shared thread. async_view() wraps an existing view so that
+its work, rendering included, runs in a pool of SHOP_ASYNC_THREADS
+threads, each with its own database connection, while the event loop
+keeps serving the other clients. whys/asgi.py turns the async views on
+with SHOP_ASYNC_VIEWS, WSGI keeps the plain ones.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, update_wrapper
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from . import profiling, routers
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'SHOP_ASYNC_THREADS', 10),
+            thread_name_prefix='shop-async'
+            )
+    return _pool
+
+
+def work(func, args, kwargs):
+    routers.check_connections()
+    try:
+        with profiling.follow():
+            return func(*args, **kwargs)
+    finally:
+        # keeps the connection of the pool thread up to CONN_MAX_AGE
+        close_old_connections()
+
+
+async def in_thread(func, *args, **kwargs):
+    """
+    Await `func` run in the pool, with the context (query logs, profile)
+    of the request.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+    pool(), partial(context.run, work, func, args, kwargs)
+    )
+
+
+def respond(view, request, args, kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render') and not response.is_rendered:
+        started = time.perf_counter()
+        response.render()
+        request._metrics_render = time.perf_counter() - started
+    return response
+
+
+def async_view(view):
+    """
+    Async version of a view function made by as_view().
+    """
+    async def wrapper(request, *args, **kwargs):
+        return await in_thread(respond, view, request, args, kwargs)
+
+    # keeps view_class/cls for the metrics and csrf_exempt of DRF views
+    return update_wrapper(wrapper, view)
+
+
+def read_view(view):
+    """
+    `view` as it is served, async with SHOP_ASYNC_VIEWS on.
+    """
+    if getattr(settings, 'SHOP_ASYNC_VIEWS', False):
+        return async_view(view)
+    return view
+
+
+class ThreadedIterator:
+    """
+    Streams the bytes of `iterable` fetched in a thread of its own, `batch`
+    items at a time. Database cursors belong to the thread that opened
+    them, so one thread serves the whole response.
+
+    Django 4.2+ consumes it asynchronously. Older versions iterate
+    streaming responses in the event loop, there __iter__ waits for each
+    batch and holds the loop meanwhile, but keeps the queries off it.
+    """
+
+    def __init__(self, iterable, batch=100):
+        self.iterable = iterable
+        self.iterator = None
+        self.batch = batch
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shop-stream')
+
+    def next_batch(self):
+        if self.iterator is None:
+            self.iterator = iter(self.iterable)
+        return b''.join(islice(self.iterator, self.batch))
+
+    def __iter__(self):
+        while True:
+            chunk = self.thread.submit(self.next_batch).result()
+            if not chunk:
+                return
+            yield chunk
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(self.thread, self.next_batch)
+            if not chunk:
+                return
+            yield chunk
+
+    def finish(self):
+        close = getattr(self.iterator, 'close', None)
+        if close is not None:
+            close()
+        connections.close_all()
+
+    def close(self):
+        self.thread.submit(self.finish)
+        self.thread.shutdown(wait=False)
@@ -0,0 +1,48 @@
+"""
+Currency rates for comparing CZK and EUR prices.
+
+Rates are read from CurrencyRate once and kept in the cache, conversion
+happens in SQL with one CASE over the currency column.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import CurrencyRate
+
+
+CACHE_KEY = 'shop:currency-rates'
+
+
+def currency_rates():
+    rates = cache.get(CACHE_KEY)
+    if rates is None:
+        rates = {'CZK': Decimal(1)}
+        rates.update(CurrencyRate.objects.values_list('mena', 'kurz'))
+        cache.set(CACHE_KEY, rates, None)
+    return rates
+
+
+def forget_rates():
+    cache.delete(CACHE_KEY)
+
+
+def price_in_czk():
+    """
+    Expression of Product.cena_decimal converted to CZK, unknown currency
+    counts as CZK and missing price as 0.
+    """
+    output = DecimalField(max_digits=20, decimal_places=2)
+    return Coalesce(
+    Case(
+    *[
+    When(mena=code, then=F('cena_decimal') * Value(rate, output_field=output))
+    for code, rate in currency_rates().items() if code != 'CZK'
+    ],
+    default=F('cena_decimal'),
+    output_field=output,
+    ),
+    Value(0, output_field=output),
+    )
@@ -0,0 +1,138 @@
+"""
+Materialized product documents.
+
+ProductDocument keeps every product as ProductDocumentSerializer returns
+it, so reading a product is one SELECT by primary key instead of joins over
+attributes, images and catalogs. Documents of products touched by an
+import or a save are rebuilt after the transaction commits.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache
+from .models import *
+from .serializers import ProductDocumentSerializer
+from .transactions import PendingIds
+
+
+CHUNK_SIZE = 500
+
+# row of the model -> products showing it in their document
+PRODUCT_LOOKUPS = {
+    ProductAttributes: 'productattributes__id__in',
+    Attribute: 'productattributes__attribute__in',
+    AttributeName: 'productattributes__attribute__nazev_atributu_id__in',
+    AttributeValue: 'productattributes__attribute__hodnota_atributu_id__in',
+    ProductImage: 'productimage__id__in',
+    Image: 'productimage__obrazek_id__in',
+    Catalog: 'catalog__in',
+}
+
+
+def affected_products(Model, ids):
+    ids = [pk for pk in ids if pk is not None]
+    if Model is Product:
+        return set(ids)
+    lookup = PRODUCT_LOOKUPS.get(Model)
+    if lookup is None:
+        return set()
+    products = set()
+    for start in range(0, len(ids), CHUNK_SIZE):
+        products.update(
+        Product.objects.filter(
+        **{lookup: ids[start:start + CHUNK_SIZE]}
+        ).values_list('id', flat=True)
+        )
+    return products
+
+
+def build(ids):
+    """
+    Write documents of the given products, documents of products which
+    no longer exist are dropped.
+    """
+    ids = sorted({pk for pk in ids if pk})
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        products = ProductDocumentSerializer.setup_eager_loading(
+        Product.objects.filter(id__in=chunk).order_by('id')
+        )
+        now = timezone.now()
+        docs = [
+        ProductDocument(product_id=row['id'], document=row, updated=now)
+        for row in ProductDocumentSerializer(products, many=True).data
+        ]
+        with transaction.atomic():
+            existing = set(
+            ProductDocument.objects.filter(product_id__in=chunk).values_list(
+            'product_id', flat=True
+            )
+            )
+            ProductDocument.objects.bulk_update(
+            [doc for doc in docs if doc.product_id in existing],
+            ['document', 'updated']
+            )
+            ProductDocument.objects.bulk_create(
+            [doc for doc in docs if doc.product_id not in existing]
+            )
+            missing = existing - {doc.product_id for doc in docs}
+            if missing:
+                ProductDocument.objects.filter(product_id__in=missing).delete()
+    return len(ids)
+
+
+def update(ids):
+    if build(ids):
+        cache.bump_versions(['ProductDocument'])
+
+
+_scheduled = PendingIds(update)
+
+
+def schedule(ids):
+    """
+    Rebuild documents of the products once the transaction commits, in
+    one go for all products the transaction touched.
+    """
+    _scheduled.add(ids)
+
+
+def product_chunks(size):
+    last = 0
+    while True:
+        ids = list(
+        Product.objects.filter(id__gt=last).order_by('id').values_list(
+        'id', flat=True
+        )[:size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def build_in_thread(ids):
+    try:
+        return build(ids)
+    finally:
+        # every thread has its own connection
+        connection.close()
+
+
+def rebuild(chunk_size=CHUNK_SIZE, workers=1):
+    """
+    Rebuild all documents, chunks are spread over `workers` threads.
+    """
+    chunks = product_chunks(chunk_size)
+    if connection.vendor == 'sqlite':
+        # one writer at a time, threads would only wait for the lock
+        workers = 1
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            count = sum(executor.map(build_in_thread, chunks))
+    else:
+        count = sum(build(ids) for ids in chunks)
+    cache.bump_versions(['ProductDocument'])
+    return count
@@ -0,0 +1,61 @@
+"""
+Streaming export of shop models.
+
+Rows are read with .iterator(), which uses a server-side cursor on
+Postgres, and many-to-many ids are loaded once per chunk, so memory use
+does not grow with the table. NDJSON output is in the `{"Model": {...}}`
+shape read by the importer.
+"""
+from django.conf import settings
+
+from .importer import chunked, relation_ids
+
+
+def export_fields(Model):
+    """
+    Names of the exported columns, the ones the import serializers accept.
+    """
+    fields = [
+    field for field in Model._meta.concrete_fields
+    if field.editable or field.primary_key
+    ]
+    return fields, list(Model._meta.many_to_many)
+
+
+def columns(Model):
+    fields, m2m = export_fields(Model)
+    return [field.name for field in fields] + [field.name for field in m2m]
+
+
+def iter_rows(Model, chunk_size=None, using=None):
+    """
+    Yield records of the model as dicts ordered by primary key, from the
+    `using` database if given.
+    """
+    chunk_size = chunk_size or getattr(settings, 'SHOP_EXPORT_CHUNK_SIZE', 2000)
+    fields, m2m = export_fields(Model)
+    names = [field.name for field in fields]
+    rows = Model._default_manager.using(using).order_by('pk').values_list(
+    *[field.attname for field in fields]
+    ).iterator(chunk_size=chunk_size)
+    pk_index = names.index(Model._meta.pk.name)
+
+    for chunk in chunked(rows, chunk_size):
+        ids = [row[pk_index] for row in chunk]
+        related = {
+        field.name: relation_ids(Model, field.name, ids, using) for field in m2m
+        }
+        for row in chunk:
+            record = dict(zip(names, row))
+            for name, values in related.items():
+                record[name] = sorted(values.get(row[pk_index], ()))
+            yield record
+
+
+def iter_records(Model, chunk_size=None, using=None):
+    """
+    Rows wrapped in the importer shape.
+    """
+    name = Model.__name__
+    for row in iter_rows(Model, chunk_size, using):
+        yield {name: row}
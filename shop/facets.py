@@ -0,0 +1,321 @@
+"""
+In-memory attribute facet index.
+
+Every (AttributeName id, AttributeValue id) pair maps to a bitmap of the
+products having it, stored as a Python int with bit n set for product n.
+Filters and facet counts are then bit operations instead of joins over
+ProductAttributes -> Attribute. Bitmaps are sized by the highest product
+id, so ids are expected to be reasonably dense.
+
+Every change bumps the version in the IndexVersion table, processes
+seeing a newer version rebuild their copy in a background thread. The
+version is mirrored in the shop cache, so requests don't query it.
+"""
+import threading
+from array import array
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from . import cache
+from .models import AttributeName, AttributeValue, IndexVersion, ProductAttributes
+
+
+INDEX_NAME = 'facets'
+VERSION_KEY = 'shop:facets:version'
+# bounds how long a version written out of order by two processes lasts
+VERSION_TIMEOUT = 60
+
+
+def popcount(bitmap):
+    return bin(bitmap).count('1')
+
+
+def to_bitmap(ids):
+    """
+    Bitmap with the bits of the ids set, in one pass over the ids.
+    """
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        data[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(data, 'little')
+
+
+def bitmap_ids(bitmap):
+    """
+    Product ids of a bitmap in ascending order.
+    """
+    ids = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        base = index * 8
+        while byte:
+            low = byte & -byte
+            ids.append(base + low.bit_length() - 1)
+            byte ^= low
+    return ids
+
+
+def parse_pairs(values):
+    """
+    ['1:3', '2:13'] -> [(1, 3), (2, 13)], malformed values are skipped.
+    """
+    pairs = []
+    for value in values:
+        name, sep, attr_value = str(value).partition(':')
+        try:
+            pairs.append((int(name), int(attr_value)))
+        except ValueError:
+            continue
+    return pairs
+
+
+class FacetIndex:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.bitmaps = {}
+        # ProductAttributes id -> product id, to find the old product of
+        # a link row that was moved to another product
+        self.link_product = array('l')
+        self.version = None
+        self.rebuilding = False
+
+
+    def rows(self, queryset):
+        return queryset.filter(
+        product__isnull=False,
+        attribute__nazev_atributu_id__isnull=False,
+        attribute__hodnota_atributu_id__isnull=False,
+        ).values_list(
+        'id', 'product_id',
+        'attribute__nazev_atributu_id', 'attribute__hodnota_atributu_id'
+        )
+
+
+    def remember_link(self, link, product):
+        if link >= len(self.link_product):
+            self.link_product.extend([0] * (link + 1 - len(self.link_product)))
+        self.link_product[link] = product
+
+
+    def load(self):
+        """
+        Bitmaps and link products read from the database, without touching
+        the index, so requests keep using it meanwhile.
+        """
+        products = defaultdict(list)
+        links = []
+        queryset = self.rows(ProductAttributes.objects.order_by())
+        for link, product, name, value in queryset.iterator(chunk_size=10000):
+            products[(name, value)].append(product)
+            links.append((link, product))
+        link_product = array('l', [0]) * (max(
+        (link for link, product in links), default=-1
+        ) + 1)
+        for link, product in links:
+            link_product[link] = product
+        bitmaps = {pair: to_bitmap(ids) for pair, ids in products.items()}
+        return bitmaps, link_product
+
+
+    def build(self, version):
+        bitmaps, link_product = self.load()
+        with self.lock:
+            # an in-place update may have moved past the loaded version
+            if self.version is None or version > self.version:
+                self.bitmaps = bitmaps
+                self.link_product = link_product
+                self.version = version
+
+
+    def update_products(self, ids):
+        """
+        Reload pairs of the given products from the database.
+        """
+        ids = {pk for pk in ids if pk}
+        if not ids:
+            return
+        keep = ~to_bitmap(ids)
+        # readers iterate the bitmaps without the lock, a new dict is
+        # swapped in instead of changing the one they may hold
+        bitmaps = {}
+        for pair, bitmap in self.bitmaps.items():
+            bitmap &= keep
+            if bitmap:
+                bitmaps[pair] = bitmap
+
+        added = defaultdict(list)
+        ids = list(ids)
+        for start in range(0, len(ids), 1000):
+            queryset = self.rows(
+            ProductAttributes.objects.filter(product_id__in=ids[start:start + 1000])
+            )
+            for link, product, name, value in queryset:
+                added[(name, value)].append(product)
+                self.remember_link(link, product)
+        for pair, products in added.items():
+            bitmaps[pair] = bitmaps.get(pair, 0) | to_bitmap(products)
+        self.bitmaps = bitmaps
+
+
+    def products_of_links(self, links):
+        products = {
+        self.link_product[link] for link in links
+        if link < len(self.link_product)
+        }
+        products.update(
+        ProductAttributes.objects.filter(id__in=links).values_list(
+        'product_id', flat=True
+        )
+        )
+        return products
+
+
+    def select(self, pairs):
+        """
+        Bitmap of products matching the pairs, values of one attribute
+        name are OR-ed, different names are AND-ed. None means no filter.
+        """
+        by_name = defaultdict(int)
+        for name, value in pairs:
+            by_name[name] |= self.bitmaps.get((name, value), 0)
+        result = None
+        for bitmap in by_name.values():
+            result = bitmap if result is None else result & bitmap
+        return result
+
+
+    def counts(self, selected=None):
+        """
+        Number of products per pair, within `selected` bitmap if given.
+        """
+        counts = {}
+        for pair, bitmap in self.bitmaps.items():
+            if selected is not None:
+                bitmap &= selected
+            count = popcount(bitmap)
+            if count:
+                counts[pair] = count
+        return counts
+
+
+_index = FacetIndex()
+
+
+def current_version():
+    """
+    Version of the data in the database, shared by all processes.
+    """
+    version = cache.backend().get(VERSION_KEY)
+    if version is None:
+        version = stored_version()
+        cache.backend().add(VERSION_KEY, version, VERSION_TIMEOUT)
+    return version
+
+
+def stored_version():
+    return IndexVersion.objects.filter(name=INDEX_NAME).values_list(
+    'version', flat=True
+    ).first() or 0
+
+
+def bump_version():
+    with transaction.atomic():
+        updated = IndexVersion.objects.filter(name=INDEX_NAME).update(
+        version=F('version') + 1
+        )
+        if not updated:
+            IndexVersion.objects.get_or_create(name=INDEX_NAME)
+            IndexVersion.objects.filter(name=INDEX_NAME).update(
+            version=F('version') + 1
+            )
+        # the row stays locked until commit, so this is our version
+        version = stored_version()
+    transaction.on_commit(
+    lambda: cache.backend().set(VERSION_KEY, version, VERSION_TIMEOUT)
+    )
+    return version
+
+
+def rebuild_in_background():
+    with _index.lock:
+        if _index.rebuilding:
+            return
+        _index.rebuilding = True
+
+    def rebuild():
+        try:
+            _index.build(current_version())
+        finally:
+            _index.rebuilding = False
+            connection.close()
+
+    threading.Thread(target=rebuild, name='shop-facets', daemon=True).start()
+
+
+def facet_index():
+    """
+    Index of this process. Only the first build blocks, when another
+    process changed the data the stale index is served until a new one
+    is built in the background, responses using it are not cached.
+    """
+    version = current_version()
+    with _index.lock:
+        if _index.version is None:
+            _index.build(version)
+        elif _index.version != version:
+            rebuild_in_background()
+            cache.served_stale()
+    return _index
+
+
+def update_products(ids):
+    """
+    Apply changes of the given products to the index of this process and
+    let other processes know their index is stale.
+    """
+    with _index.lock:
+        current = _index.version is not None
+        current = current and _index.version == current_version()
+        version = bump_version()
+        # nobody else changed the data in between, update in place
+        if current and version == _index.version + 1:
+            _index.update_products(ids)
+            _index.version = version
+        elif _index.version is not None:
+            rebuild_in_background()
+
+
+def update_links(links):
+    with _index.lock:
+        update_products(_index.products_of_links(links))
+
+
+def update_attributes(ids):
+    products = ProductAttributes.objects.filter(
+    attribute_id__in=list(ids)
+    ).values_list('product_id', flat=True)
+    update_products(set(products))
+
+
+def facet_list(selected=None):
+    """
+    Facet counts with attribute names and values for templates and API.
+    """
+    counts = facet_index().counts(selected)
+    names = AttributeName.objects.in_bulk({name for name, value in counts})
+    values = AttributeValue.objects.in_bulk({value for name, value in counts})
+    facets = []
+    for (name, value), count in sorted(counts.items()):
+        facets.append({
+        'attr': '%s:%s' % (name, value),
+        'name': getattr(names.get(name), 'nazev', None),
+        'code': getattr(names.get(name), 'kod', None),
+        'value': getattr(values.get(value), 'hodnota', None),
+        'count': count,
+        })
+    return facets
@@ -1,10 +1,41 @@
 import django_filters
-from django_filters import CharFilter
+from django_filters import (
+BaseInFilter, CharFilter, IsoDateTimeFilter, NumberFilter
+)
+from .facets import facet_index, bitmap_ids, parse_pairs
 from .models import Product
 
+
+class PairsFilter(BaseInFilter, CharFilter):
+    pass
+
+
 class ProductFilter(django_filters.FilterSet):
-    name = CharFilter(field_name = 'name', lookup_expr = 'icontains')
+    name = CharFilter(field_name = 'nazev', lookup_expr = 'icontains')
     description = CharFilter(field_name = 'description', lookup_expr = 'icontains')
+    # ?attr=<AttributeName id>:<AttributeValue id>,...
+    attr = PairsFilter(method='filter_attr', label='Atributy')
+    cena_min = NumberFilter(field_name='cena_decimal', lookup_expr='gte', label='Cena od')
+    cena_max = NumberFilter(field_name='cena_decimal', lookup_expr='lte', label='Cena do')
+    published_after = IsoDateTimeFilter(
+    field_name='published_at', lookup_expr='gte', label='Publikovano od'
+    )
+    published_before = IsoDateTimeFilter(
+    field_name='published_at', lookup_expr='lte', label='Publikovano do'
+    )
+
+    def filter_attr(self, queryset, name, value):
+        selected = facet_index().select(parse_pairs(value))
+        if selected is None:
+            return queryset
+        return queryset.filter(id__in=bitmap_ids(selected))
+
+    def selected_bitmap(self):
+        """
+        Bitmap of products matching the attr filter, None without it.
+        """
+        values = self.form.cleaned_data.get('attr') if self.form.is_valid() else None
+        return facet_index().select(parse_pairs(values or []))
 
     class Meta:
         model = Product
@@ -0,0 +1,546 @@
+"""
+Bulk import of records in the `{"Model": {...}}` shape of test_data.json.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.db.models import UniqueConstraint
+from django.dispatch import Signal
+from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.settings import api_settings
+
+from .serializers import *
+
+
+transfer_dict = {
+    'AttributeName': AttrNameSerializer,
+    'AttributeValue': AttrValueSerializer,
+    'Attribute': AttrSerializer,
+    'ProductAttributes': ProductAttrSerializer,
+    'Image': ImagesSerializer,
+    'ProductImage': ProductImgSerializer,
+    'Product': ProductSerializer,
+    'Catalog': CatalogSerializer,
+}
+
+# Groups are loaded in this order, so foreign keys always point to rows
+# which were written before.
+import_order = [
+    'AttributeName',
+    'AttributeValue',
+    'Image',
+    'Attribute',
+    'Product',
+    'ProductAttributes',
+    'ProductImage',
+    'Catalog',
+]
+
+
+# Sent before existing rows of a batch are overwritten and after the batch
+# is written, with `ids` of the rows.
+records_importing = Signal()
+records_imported = Signal()
+
+
+def content_hash(row):
+    """
+    Stable hash of a record, independent of key order.
+    """
+    dump = json.dumps(
+    row, sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    default=str
+    )
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+def chunked(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def unique_fields(Model):
+    """
+    Field name tuples which have to be unique together.
+    """
+    fields = [
+    constraint.fields for constraint in Model._meta.constraints
+    if isinstance(constraint, UniqueConstraint) and constraint.condition is None
+    ]
+    return fields + [tuple(names) for names in Model._meta.unique_together]
+
+
+def relation_ids(Model, name, ids, using=None):
+    """
+    {pk: set of related pks} of a many-to-many field, in one query.
+    """
+    field = Model._meta.get_field(name)
+    source = field.m2m_field_name() + '_id'
+    target = field.m2m_reverse_field_name() + '_id'
+    current = defaultdict(set)
+    rows = field.remote_field.through.objects.using(using).filter(
+    **{source + '__in': ids}
+    ).values_list(source, target)
+    for pk, related in rows:
+        current[pk].add(related)
+    return current
+
+
+class Importer:
+    """
+    Load records grouped by model in dependency order.
+
+    Existing ids are fetched with one `id__in` query per batch, rows are
+    written with bulk_create / bulk_update. Rows whose content hash matches
+    the one stored by the previous import are skipped without validation.
+    `summary` holds created, updated, unchanged and failed counts per model.
+
+    With `dry_run` nothing is written, the summary also lists changed
+    fields of updated rows and dangling foreign key references.
+    """
+
+    def __init__(self, batch_size=None, chunk_size=None, dry_run=False):
+        self.batch_size = batch_size or getattr(
+        settings, 'SHOP_IMPORT_BATCH_SIZE', 1000
+        )
+        self.chunk_size = chunk_size or getattr(
+        settings, 'SHOP_IMPORT_CHUNK_SIZE', 5000
+        )
+        self.max_errors = getattr(settings, 'SHOP_IMPORT_MAX_ERRORS', 100)
+        self.dry_run = dry_run
+        self.summary = {}
+        self.touched = set()
+        # ids a dry run would insert, rows referencing them are valid
+        self.pending_ids = defaultdict(set)
+
+
+    def run(self, records):
+        with transaction.atomic():
+            self.load(records)
+            self.reset_sequences()
+            if self.dry_run:
+                transaction.set_rollback(True)
+        return self.summary
+
+
+    def run_stream(self, records, on_chunk=None):
+        """
+        Load records from an iterator, each chunk of `chunk_size` records
+        is committed on its own so memory stays flat for any input size.
+        Dependency order holds within a chunk, across chunks the records
+        have to come in the order of the feed.
+
+        `on_chunk(chunk)` is called inside the chunk's transaction.
+        """
+        for chunk in chunked(records, self.chunk_size):
+            with transaction.atomic():
+                self.load(chunk)
+                self.reset_sequences()
+                if self.dry_run:
+                    transaction.set_rollback(True)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+        return self.summary
+
+
+    def load(self, records):
+        groups = defaultdict(list)
+        for i in records:
+            if not isinstance(i, dict):
+                continue
+            model = ''.join(i)
+            if model in transfer_dict:
+                groups[model].append(i.get(model) or {})
+
+        for model in import_order:
+            rows = groups.get(model, [])
+            for start in range(0, len(rows), self.batch_size):
+                self.load_batch(model, rows[start:start + self.batch_size])
+        return self.summary
+
+
+    def counts(self, model):
+        if model not in self.summary:
+            self.summary[model] = {
+            'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'errors': []
+            }
+            if self.dry_run:
+                self.summary[model].update(changes=[], dangling=[])
+        return self.summary[model]
+
+
+    def add_error(self, model, row, errors):
+        counts = self.counts(model)
+        counts['failed'] += 1
+        if len(counts['errors']) < self.max_errors:
+            counts['errors'].append({'id': row.get('id'), 'errors': errors})
+        if not self.dry_run:
+            return
+        for field, details in errors.items():
+            if not isinstance(details, list):
+                continue
+            codes = {getattr(detail, 'code', None) for detail in details}
+            if ('does_not_exist' in codes
+            and len(counts['dangling']) < self.max_errors):
+                counts['dangling'].append(
+                {'id': row.get('id'), 'field': field, 'value': row.get(field)}
+                )
+
+
+    def clean_rows(self, model, Model, rows):
+        """
+        Rows which are not objects or have an invalid id fail alone, the
+        batch queries below would raise for them.
+        """
+        for row in rows:
+            if not isinstance(row, dict):
+                self.add_error(model, {}, {api_settings.NON_FIELD_ERRORS_KEY: [
+                ErrorDetail(
+                serializers.Serializer.default_error_messages['invalid'].format(
+                datatype=type(row).__name__
+                ),
+                code='invalid'
+                )
+                ]})
+                continue
+            if row.get('id') is not None:
+                try:
+                    row = {**row, 'id': Model._meta.pk.to_python(row['id'])}
+                except DjangoValidationError as e:
+                    self.add_error(model, row, {'id': [
+                    ErrorDetail(message, code=e.code) for message in e.messages
+                    ]})
+                    continue
+            yield row
+
+
+    def load_batch(self, model, rows):
+        Model = apps.get_model('shop', model)
+        counts = self.counts(model)
+        m2m_names = [f.name for f in Model._meta.many_to_many]
+
+        # a record repeated in one batch is merged, later values win like
+        # they would with one save() per record
+        merged = {}
+        for row in self.clean_rows(model, Model, rows):
+            key = row.get('id')
+            if key is None:
+                merged[object()] = row
+            else:
+                merged[key] = {**merged.get(key, {}), **row}
+        rows = list(merged.values())
+
+        ids = [row['id'] for row in rows if row.get('id') is not None]
+        existing = set(
+        Model.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+
+        hashes = {
+        row['id']: content_hash(row) for row in rows
+        if row.get('id') is not None
+        }
+        stored = dict(
+        RecordHash.objects.filter(
+        model=model, record_id__in=ids
+        ).values_list('record_id', 'hash')
+        )
+        changed = []
+        for row in rows:
+            pk = row.get('id')
+            if pk in existing and stored.get(pk) == hashes[pk]:
+                counts['unchanged'] += 1
+            else:
+                changed.append(row)
+        rows = changed
+        if not rows:
+            return
+
+        serializer = transfer_dict[model](
+        data=rows, many=True, context={'pending_ids': self.pending_ids}
+        )
+        serializer.is_valid()
+        validated = iter(serializer.validated_data)
+
+        failed = set(serializer.row_errors)
+        to_create = []
+        to_update = []
+        row_index = {}
+        relations = defaultdict(dict)
+        for index, row in enumerate(rows):
+            if index in failed:
+                self.add_error(model, row, serializer.row_errors[index])
+                continue
+
+            data = dict(next(validated))
+            related = {
+            name: data.pop(name) for name in m2m_names if name in data
+            }
+            obj = Model(id=row.get('id'), **data)
+            fields = set(data)
+            # bulk writes skip save(), typed copies are filled here
+            typed_fields = getattr(Model, 'typed_fields', {})
+            if typed_fields:
+                obj.sync_typed_fields()
+                fields.update(
+                typed for name, typed in typed_fields.items() if name in fields
+                )
+            row_index[id(obj)] = index
+            if obj.id in existing:
+                to_update.append((obj, tuple(sorted(fields))))
+            else:
+                to_create.append(obj)
+            for name, values in related.items():
+                relations[name][obj] = values
+
+        conflicts = self.find_conflicts(
+        Model, to_create + [obj for obj, fields in to_update]
+        )
+        if conflicts:
+            for obj in to_create + [obj for obj, fields in to_update]:
+                if id(obj) in conflicts:
+                    index = row_index[id(obj)]
+                    failed.add(index)
+                    self.add_error(model, rows[index], {
+                    'non_field_errors': [
+                    'Duplicate of record %s.' % conflicts[id(obj)]
+                    ]
+                    })
+            to_create = [obj for obj in to_create if id(obj) not in conflicts]
+            to_update = [
+            (obj, fields) for obj, fields in to_update
+            if id(obj) not in conflicts
+            ]
+            for values in relations.values():
+                for obj in [obj for obj in values if id(obj) in conflicts]:
+                    del values[obj]
+
+        if self.dry_run:
+            self.plan(Model, counts, to_create, to_update, relations)
+            return
+
+        # a batch is written in a savepoint, a constraint the checks above
+        # missed fails its rows instead of the whole import
+        try:
+            with transaction.atomic():
+                self.write(Model, to_create, to_update, relations)
+        except IntegrityError as error:
+            for obj in to_create + [obj for obj, fields in to_update]:
+                index = row_index[id(obj)]
+                failed.add(index)
+                self.add_error(model, rows[index], {
+                'non_field_errors': ['Batch was not written: %s' % error]
+                })
+            return
+        counts['created'] += len(to_create)
+        counts['updated'] += len(to_update)
+        if to_create or to_update:
+            self.touched.add(Model)
+
+        written = [
+        row['id'] for index, row in enumerate(rows)
+        if index not in failed and row.get('id') is not None
+        ]
+        self.store_hashes(model, written, hashes)
+
+
+    def write(self, Model, to_create, to_update, relations):
+        if to_update:
+            records_importing.send(
+            sender=Model, ids=[obj.pk for obj, fields in to_update]
+            )
+
+        # rows taking over a unique key from another row of the batch give
+        # up their old key first and are written after the others, inserts
+        # go last as they may reuse a key an update has just released
+        moving = self.moving_rows(Model, to_update)
+        if moving:
+            nullable = {
+            name for fields in unique_fields(Model) for name in fields
+            if Model._meta.get_field(name).null
+            }
+            Model.objects.filter(
+            pk__in=[obj.pk for obj, fields in moving]
+            ).update(**{name: None for name in nullable})
+        staying = [item for item in to_update if item not in moving]
+        for group in (staying, moving):
+            # bulk_update needs one field list, rows are grouped by the
+            # fields they actually carry
+            by_fields = defaultdict(list)
+            for obj, fields in group:
+                by_fields[fields].append(obj)
+            for fields, objs in by_fields.items():
+                if fields:
+                    Model.objects.bulk_update(
+                    objs, fields, batch_size=self.batch_size
+                    )
+
+        if to_create:
+            Model.objects.bulk_create(to_create, batch_size=self.batch_size)
+
+        self.set_relations(Model, relations)
+        if to_create or to_update:
+            records_imported.send(
+            sender=Model,
+            ids=[obj.pk for obj in to_create if obj.pk is not None]
+            + [obj.pk for obj, fields in to_update]
+            )
+
+
+    def moving_rows(self, Model, to_update):
+        """
+        Updated rows whose new unique values another row of the batch holds
+        at the moment, e.g. two links swapping their attributes.
+        """
+        ids = [obj.pk for obj, fields in to_update]
+        moving = []
+        for names in unique_fields(Model):
+            attnames = [Model._meta.get_field(name).attname for name in names]
+            held = {
+            tuple(row[1:]): row[0]
+            for row in Model.objects.filter(pk__in=ids).values_list(
+            'pk', *attnames
+            )
+            }
+            for obj, fields in to_update:
+                if not set(names) <= set(fields):
+                    continue
+                key = tuple(getattr(obj, name) for name in attnames)
+                if (None not in key and held.get(key, obj.pk) != obj.pk
+                and (obj, fields) not in moving):
+                    moving.append((obj, fields))
+        return moving
+
+
+    def find_conflicts(self, Model, objs):
+        """
+        Rows breaking a unique constraint, because an earlier row of the
+        batch or an existing row with another id has the same values.
+        Returns {id(obj): pk of the kept record}, NULLs never conflict.
+        """
+        conflicts = {}
+        ids = [obj.pk for obj in objs if obj.pk is not None]
+        for fields in unique_fields(Model):
+            attnames = [Model._meta.get_field(name).attname for name in fields]
+            keys = [tuple(getattr(obj, name) for name in attnames) for obj in objs]
+            lookups = {
+            name + '__in': {key[position] for key in keys} - {None}
+            for position, name in enumerate(attnames)
+            }
+            taken = {
+            tuple(row[1:]): row[0]
+            for row in Model.objects.filter(**lookups).exclude(
+            pk__in=ids
+            ).values_list('pk', *attnames)
+            }
+            for obj, key in zip(objs, keys):
+                if None in key or id(obj) in conflicts:
+                    continue
+                if key in taken:
+                    conflicts[id(obj)] = taken[key]
+                else:
+                    taken[key] = obj.pk
+        return conflicts
+
+
+    def plan(self, Model, counts, to_create, to_update, relations):
+        """
+        Dry run of a batch, compares rows to be updated with the database
+        using one query for columns and one per many-to-many field.
+        """
+        self.pending_ids[Model].update(
+        obj.pk for obj in to_create if obj.pk is not None
+        )
+        counts['created'] += len(to_create)
+
+        ids = [obj.pk for obj, fields in to_update]
+        current = {
+        row['id']: row for row in Model.objects.filter(id__in=ids).values()
+        }
+        current_related = {
+        name: self.current_relations(Model, name, ids) for name in relations
+        }
+        for obj, fields in to_update:
+            changes = {}
+            for name in fields:
+                attname = Model._meta.get_field(name).attname
+                old = current[obj.pk].get(attname)
+                new = getattr(obj, attname)
+                if old != new:
+                    changes[name] = [old, new]
+            for name, values in relations.items():
+                if obj in values:
+                    old = current_related[name].get(obj.pk, set())
+                    new = {item.pk for item in values[obj]}
+                    if old != new:
+                        changes[name] = [sorted(old), sorted(new)]
+
+            if not changes:
+                counts['unchanged'] += 1
+                continue
+            counts['updated'] += 1
+            if len(counts['changes']) < self.max_errors:
+                counts['changes'].append({'id': obj.pk, 'fields': changes})
+
+
+    def current_relations(self, Model, name, ids):
+        return relation_ids(Model, name, ids)
+
+
+    def store_hashes(self, model, ids, hashes):
+        RecordHash.objects.filter(model=model, record_id__in=ids).delete()
+        RecordHash.objects.bulk_create(
+        [RecordHash(model=model, record_id=pk, hash=hashes[pk]) for pk in ids],
+        batch_size=self.batch_size
+        )
+
+
+    def set_relations(self, Model, relations):
+        """
+        Replace many-to-many rows of the written objects, like
+        serializer.save() does, with one delete and one bulk insert.
+        """
+        for name, values in relations.items():
+            field = Model._meta.get_field(name)
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            values = {
+            obj.pk: related for obj, related in values.items()
+            if obj.pk is not None
+            }
+            through.objects.filter(**{source + '__in': list(values)}).delete()
+            through.objects.bulk_create(
+            [
+            through(**{source: pk, target: item.pk})
+            for pk, related in values.items()
+            for item in related
+            ],
+            batch_size=self.batch_size,
+            )
+
+
+    def reset_sequences(self):
+        """
+        Rows are inserted with explicit ids, move the id sequences past them.
+        """
+        if not self.touched:
+            return
+        statements = connection.ops.sequence_reset_sql(
+        no_style(), list(self.touched)
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        self.touched = set()
@@ -0,0 +1,181 @@
+"""
+Import jobs queued in the database and processed by a local worker pool.
+
+Progress is committed together with each chunk of records, so a job
+interrupted by a crash is resumed after the last committed chunk.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .importer import Importer
+from .models import ImportJob
+from .parsers import iter_records
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def job_dir():
+    path = getattr(settings, 'SHOP_IMPORT_JOB_DIR', settings.BASE_DIR / 'import_jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def submit(stream):
+    """
+    Store the payload from `stream` and queue a job for it.
+    """
+    path = os.path.join(job_dir(), '%s.json' % uuid.uuid4().hex)
+    with open(path, 'wb') as fh:
+        shutil.copyfileobj(stream, fh, 1024 * 1024)
+    job = ImportJob.objects.create(payload=path)
+
+    if getattr(settings, 'SHOP_IMPORT_WORKER', 'inprocess') == 'inprocess':
+        transaction.on_commit(lambda: executor().submit(run_in_worker))
+    return job
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+        max_workers=getattr(settings, 'SHOP_IMPORT_WORKERS', 2),
+        thread_name_prefix='import-job'
+        )
+    return _executor
+
+
+def claim(job):
+    """
+    Mark a queued job as running, False when another worker was faster.
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(
+    pk=job.pk, status=ImportJob.QUEUED
+    ).update(status=ImportJob.RUNNING, started=now, heartbeat=now)
+    return bool(claimed)
+
+
+def requeue_stale():
+    """
+    Jobs whose worker stopped sending heartbeats are queued again.
+    """
+    timeout = getattr(settings, 'SHOP_IMPORT_JOB_TIMEOUT', 600)
+    limit = timezone.now() - timedelta(seconds=timeout)
+    return ImportJob.objects.filter(
+    status=ImportJob.RUNNING, heartbeat__lt=limit
+    ).update(status=ImportJob.QUEUED)
+
+
+def run_pending():
+    """
+    Process queued jobs until the queue is empty, returns number of jobs.
+    """
+    done = 0
+    requeue_stale()
+    while True:
+        job = ImportJob.objects.filter(
+        status=ImportJob.QUEUED
+        ).order_by('id').first()
+        if job is None:
+            return done
+        if claim(job):
+            process(job)
+            done += 1
+
+
+def run_in_worker():
+    """
+    run_pending() in a thread of the pool, which owns its connection.
+    """
+    try:
+        return run_pending()
+    finally:
+        close_old_connections()
+
+
+def process(job):
+    importer = Importer()
+    importer.summary = job.summary or {}
+    processed = job.processed
+
+    def progress(chunk):
+        nonlocal processed
+        processed += len(chunk)
+        ImportJob.objects.filter(pk=job.pk).update(
+        processed=processed, summary=importer.summary,
+        heartbeat=timezone.now()
+        )
+
+    try:
+        with open(job.payload, 'rb') as stream:
+            records = islice(iter_records(stream), job.processed, None)
+            importer.run_stream(records, on_chunk=progress)
+    except Exception as exc:
+        logger.exception('Import job %s failed', job.pk)
+        ImportJob.objects.filter(pk=job.pk).update(
+        status=ImportJob.FAILED, error=str(exc), finished=timezone.now()
+        )
+        return
+
+    ImportJob.objects.filter(pk=job.pk).update(
+    status=ImportJob.DONE, summary=importer.summary, finished=timezone.now()
+    )
+    try:
+        os.remove(job.payload)
+    except OSError:
+        pass
+
+
+def start():
+    """
+    Resume jobs of the in-process worker left queued or stale by a
+    restart, called by the server entry points. A thread looks for them
+    right away and every SHOP_IMPORT_JOB_POLL seconds after.
+    """
+    global _watcher
+    if getattr(settings, 'SHOP_IMPORT_WORKER', 'inprocess') != 'inprocess':
+        return
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = threading.Thread(
+            target=watch, name='import-watch', daemon=True
+            )
+            _watcher.start()
+
+
+def watch():
+    poll = getattr(settings, 'SHOP_IMPORT_JOB_POLL', 60)
+    while True:
+        # jobs run in the pool, claim() keeps them from running twice
+        executor().submit(run_in_worker)
+        time.sleep(poll)
+
+
+def work(poll=2.0, once=False):
+    """
+    Worker loop of the import_worker management command.
+    """
+    while True:
+        try:
+            run_pending()
+        finally:
+            close_old_connections()
+        if once:
+            return
+        time.sleep(poll)
@@ -0,0 +1,183 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from shop.benchmark import generate, timed
+from shop.importer import Importer
+from shop.parsers import iter_records
+from shop.renderers import NDJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+    'Time import, listing, search, detail and export on a synthetic '
+    'catalog in a throwaway test database and write the results as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--output', default='-', help='File path, "-" for stdout.')
+        parser.add_argument(
+        '--compare', default=None,
+        help='Results of an earlier run, medians are compared with it.'
+        )
+        parser.add_argument(
+        '--keepdb', action='store_true',
+        help='Keep the test database between runs (the catalog is still imported).'
+        )
+
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, keepdb=options['keepdb'])
+        old_config = runner.setup_databases()
+        try:
+            results = self.run(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        data = {'meta': self.meta(options), 'results': results}
+        output = json.dumps(data, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as stream:
+                stream.write(output + '\n')
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=settings.BASE_DIR
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+        'commit': commit,
+        'timestamp': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'products': options['products'],
+        'seed': options['seed'],
+        'repeat': options['repeat'],
+        }
+
+
+    def run(self, options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.ndjson')
+            with open(path, 'wb') as stream:
+                stream.writelines(NDJSONRenderer().lines(
+                generate(options['products'], options['seed'])
+                ))
+            results['import'] = self.time_import(path, options['chunk_size'])
+
+        client = Client()
+        client.force_login(User.objects.create_user('benchmark'))
+        ids = random.Random(options['seed']).sample(
+        range(1, options['products'] + 1), min(options['repeat'], options['products'])
+        )
+        repeat = options['repeat']
+
+        def get(url):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError('%s returned %s' % (url, response.status_code))
+            return response
+
+        def get_each(pattern):
+            urls = iter([pattern % pk for pk in ids] * (repeat // len(ids) + 1))
+            return lambda: get(next(urls))
+
+        # measure the work of the views, not the response cache
+        with override_settings(SHOP_VIEW_CACHE=False):
+            results['product_api_list'] = timed(lambda: get('/api/product/'), repeat)
+            results['product_api_filter'] = timed(
+            lambda: get('/api/product/?cena_min=100&cena_max=1000'), repeat
+            )
+            results['product_page'] = timed(lambda: get('/product/'), repeat)
+            results['product_search'] = timed(
+            lambda: get('/api/product/search/?q=lampa'), repeat
+            )
+            results['product_detail'] = timed(get_each('/api/product/%s/'), repeat)
+            results['document_detail'] = timed(get_each('/api/documents/%s/'), repeat)
+            results['record_detail'] = timed(get_each('/detail/Product/%s/'), repeat)
+            results['export'] = self.time_export(client)
+        return results
+
+
+    def time_import(self, path, chunk_size):
+        start = time.perf_counter()
+        with open(path, 'rb') as stream:
+            summary = Importer(chunk_size=chunk_size).run_stream(iter_records(stream))
+        seconds = time.perf_counter() - start
+        records = sum(
+        counts['created'] + counts['updated'] + counts['unchanged'] + counts['failed']
+        for counts in summary.values()
+        )
+        failed = sum(counts['failed'] for counts in summary.values())
+        if failed:
+            raise CommandError('%s records failed to import' % failed)
+        return {
+        'records': records,
+        'seconds': round(seconds, 3),
+        'records_per_second': round(records / seconds, 1),
+        }
+
+
+    def time_export(self, client):
+        start = time.perf_counter()
+        first = None
+        size = 0
+        rows = 0
+        response = client.get('/export/Product/')
+        for chunk in response.streaming_content:
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(chunk)
+            rows += chunk.count(b'\n')
+        seconds = time.perf_counter() - start
+        return {
+        'rows': rows,
+        'bytes': size,
+        'seconds': round(seconds, 3),
+        'first_byte_ms': round((first or seconds) * 1000, 3),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        }
+
+
+    def compare(self, path, results):
+        with open(path) as stream:
+            previous = json.load(stream)['results']
+        for name, values in results.items():
+            before = previous.get(name, {})
+            for key in ('median_ms', 'records_per_second', 'rows_per_second'):
+                if key in values and before.get(key):
+                    change = (values[key] - before[key]) / before[key] * 100
+                    self.stderr.write(
+                    '%-20s %-18s %12s -> %12s  %+.1f %%'
+                    % (name, key, before[key], values[key], change)
+                    )
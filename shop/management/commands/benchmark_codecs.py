@@ -0,0 +1,126 @@
+import gc
+import gzip
+import io
+import json
+import platform
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from shop import parsers, renderers
+from shop.benchmark import generate, timed as timed_with_gc
+from shop.middleware import brotli, compress_chunks
+from shop.parsers import NDJSONParser, StreamingJSONParser, iter_records
+
+
+def timed(func, repeat):
+    """
+    Timings without garbage collection, which otherwise walks the whole
+    catalog in the middle of random runs, as timeit does.
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        return timed_with_gc(func, repeat)
+    finally:
+        gc.enable()
+
+
+class Command(BaseCommand):
+    help = (
+    'Time the JSON, NDJSON and MessagePack parsers and renderers against '
+    'the stdlib based ones on a synthetic catalog, and gzip/brotli on '
+    'the JSON body. No database is used.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--output', default='-', help='File path, "-" for stdout.')
+
+
+    def handle(self, *args, **options):
+        records = list(generate(options['products'], options['seed']))
+        repeat = options['repeat']
+        results = {}
+
+        json_body = JSONRenderer().render(records)
+        ndjson_body = b''.join(renderers.NDJSONRenderer().lines(records))
+        sizes = {'json': len(json_body), 'ndjson': len(ndjson_body)}
+
+        results['render_json_stdlib'] = timed(lambda: JSONRenderer().render(records), repeat)
+        if renderers.orjson is not None:
+            results['render_json_orjson'] = timed(
+            lambda: renderers.ORJSONRenderer().render(records), repeat
+            )
+
+        results['parse_json_stdlib'] = timed(
+        lambda: JSONParser().parse(io.BytesIO(json_body)), repeat
+        )
+        results['parse_json_streaming'] = timed(
+        lambda: list(iter_records(io.BytesIO(json_body))), repeat
+        )
+        results['parse_ndjson_streaming'] = timed(
+        lambda: list(iter_records(io.BytesIO(ndjson_body))), repeat
+        )
+        if parsers.orjson is not None:
+            results['parse_json_orjson'] = timed(
+            lambda: parsers.ORJSONParser().parse(io.BytesIO(json_body)), repeat
+            )
+            results['parse_json_import'] = timed(
+            lambda: list(self.import_parse(StreamingJSONParser(), json_body)), repeat
+            )
+            results['parse_ndjson_import'] = timed(
+            lambda: list(self.import_parse(NDJSONParser(), ndjson_body)), repeat
+            )
+
+        if renderers.msgpack is not None:
+            packed = renderers.MessagePackRenderer().render(records)
+            sizes['msgpack'] = len(packed)
+            results['render_msgpack'] = timed(
+            lambda: renderers.MessagePackRenderer().render(records), repeat
+            )
+            results['parse_msgpack_import'] = timed(
+            lambda: list(parsers.StreamingMessagePackParser().parse(io.BytesIO(packed))),
+            repeat
+            )
+
+        codings = ['gzip'] + (['br'] if brotli is not None else [])
+        for coding in codings:
+            compressed = b''.join(compress_chunks([json_body], coding))
+            sizes['json_%s' % coding] = len(compressed)
+            results['compress_json_%s' % coding] = timed(
+            lambda: b''.join(compress_chunks([json_body], coding)), repeat
+            )
+        # gzip is checked to round-trip, any other coding comes from a library
+        assert gzip.decompress(b''.join(compress_chunks([json_body], 'gzip'))) == json_body
+
+        data = {
+        'meta': {
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'products': options['products'],
+        'records': len(records),
+        'repeat': repeat,
+        'bytes': sizes,
+        },
+        'results': results,
+        }
+        output = json.dumps(data, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as stream:
+                stream.write(output + '\n')
+
+
+    def import_parse(self, parser, body):
+        """
+        Records as the Import view gets them, Content-Length included.
+        """
+        request = RequestFactory().put('/', body, content_type=parser.media_type)
+        return parser.parse(io.BytesIO(body), parser_context={'request': request})
@@ -0,0 +1,54 @@
+import sys
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import exporter
+from shop.importer import import_order
+from shop.renderers import CSVRenderer, NDJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+    'Export records as NDJSON readable by import_records, or as CSV. '
+    'Without model names all imported models are exported in import order.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Model names, e.g. Product.')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--output', default='-', help='File path, "-" for stdout.')
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+
+    def handle(self, *args, **options):
+        names = options['models'] or import_order
+        if options['format'] == 'csv' and len(names) != 1:
+            raise CommandError('CSV export needs exactly one model.')
+        try:
+            models = [apps.get_model('shop', name) for name in names]
+        except LookupError as exc:
+            raise CommandError(exc)
+
+        if options['output'] == '-':
+            self.write(sys.stdout.buffer, models, options)
+            sys.stdout.flush()
+        else:
+            with open(options['output'], 'wb') as stream:
+                self.write(stream, models, options)
+
+
+    def write(self, stream, models, options):
+        chunk_size = options['chunk_size']
+        if options['format'] == 'csv':
+            Model = models[0]
+            lines = CSVRenderer().lines(
+            exporter.iter_rows(Model, chunk_size), header=exporter.columns(Model)
+            )
+            stream.writelines(lines)
+            return
+        renderer = NDJSONRenderer()
+        for Model in models:
+            stream.writelines(
+            renderer.lines(exporter.iter_records(Model, chunk_size))
+            )
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from shop.benchmark import generate
+from shop.renderers import NDJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Write a synthetic catalog as NDJSON readable by import_records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', default='-', help='File path, "-" for stdout.')
+
+
+    def handle(self, *args, **options):
+        lines = NDJSONRenderer().lines(
+        generate(options['products'], options['seed'])
+        )
+        if options['output'] == '-':
+            sys.stdout.buffer.writelines(lines)
+            sys.stdout.flush()
+        else:
+            with open(options['output'], 'wb') as stream:
+                stream.writelines(lines)
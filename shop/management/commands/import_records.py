@@ -0,0 +1,51 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importer import Importer
+from shop.parsers import iter_records
+
+
+class Command(BaseCommand):
+    help = 'Import records from a JSON array or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the file, "-" for stdin.')
+        parser.add_argument(
+        '--chunk-size', type=int, default=None,
+        help='Number of records committed in one transaction.'
+        )
+        parser.add_argument(
+        '--dry-run', action='store_true',
+        help='Report inserts, updates and dangling references, write nothing.'
+        )
+
+
+    def handle(self, *args, **options):
+        path = options['path']
+        importer = Importer(
+        chunk_size=options['chunk_size'], dry_run=options['dry_run']
+        )
+        processed = 0
+
+        def progress(chunk):
+            nonlocal processed
+            processed += len(chunk)
+            if options['verbosity'] > 1:
+                self.stdout.write('%s records committed' % processed)
+
+        try:
+            if path == '-':
+                records = iter_records(sys.stdin.buffer)
+                summary = importer.run_stream(records, on_chunk=progress)
+            else:
+                with open(path, 'rb') as stream:
+                    records = iter_records(stream)
+                    summary = importer.run_stream(records, on_chunk=progress)
+        except OSError as exc:
+            raise CommandError(exc)
+        except ValueError as exc:
+            raise CommandError('JSON parse error - %s' % exc)
+
+        self.stdout.write(json.dumps(summary, indent=2, ensure_ascii=False))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shop import jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued import jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+        '--once', action='store_true',
+        help='Process the queued jobs and exit.'
+        )
+        parser.add_argument(
+        '--poll', type=float, default=2.0,
+        help='Seconds between checks of an empty queue.'
+        )
+
+
+    def handle(self, *args, **options):
+        jobs.work(poll=options['poll'], once=options['once'])
@@ -0,0 +1,182 @@
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop.benchmark import summarize
+
+
+DEFAULT_PATHS = [
+'/api/product/', '/api/product/search/?q=lampa', '/product/',
+'/detail/Product/', '/detail/Product/1/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+    'Load a running server with concurrent keep-alive clients and report '
+    'throughput and tail latency per concurrency level. Run it against '
+    'the WSGI deployment (e.g. gunicorn whys.wsgi) and the ASGI one '
+    '(e.g. uvicorn whys.asgi:application) and compare the two with --compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+        '--path', action='append', dest='paths',
+        help='Path to request, can repeat. Clients cycle through them.'
+        )
+        parser.add_argument(
+        '--concurrency', type=int, nargs='+', default=[1, 10, 50, 200]
+        )
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per level.')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument(
+        '--header', action='append', default=[],
+        help='"Name: value", e.g. the Cookie of a logged in session.'
+        )
+        parser.add_argument('--label', default=None, help='e.g. wsgi or asgi.')
+        parser.add_argument('--output', default='-', help='File path, "-" for stdout.')
+        parser.add_argument(
+        '--compare', default=None,
+        help='Results of an earlier run, throughput and latency are compared with it.'
+        )
+
+
+    def handle(self, *args, **options):
+        target = urlsplit(options['url'])
+        if target.scheme not in ('http', 'https') or not target.hostname:
+            raise CommandError('--url has to be an http(s) URL.')
+        headers = {}
+        for header in options['header']:
+            name, sep, value = header.partition(':')
+            if not sep:
+                raise CommandError('Header %r is not "Name: value".' % header)
+            headers[name.strip()] = value.strip()
+        paths = [
+        target.path.rstrip('/') + path for path in options['paths'] or DEFAULT_PATHS
+        ]
+
+        client = Client(target, headers, options['timeout'])
+        for path in paths:
+            status = client.get(path)
+            if status != 200:
+                raise CommandError('%s returned %s' % (path, status))
+
+        results = {}
+        for concurrency in options['concurrency']:
+            results[str(concurrency)] = self.run_level(
+            target, headers, paths, concurrency, options
+            )
+
+        data = {
+        'meta': {
+        'url': options['url'],
+        'label': options['label'],
+        'timestamp': timezone.now().isoformat(),
+        'paths': paths,
+        'duration': options['duration'],
+        },
+        'results': results,
+        }
+        output = json.dumps(data, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as stream:
+                stream.write(output + '\n')
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+
+    def run_level(self, target, headers, paths, concurrency, options):
+        timings = []
+        errors = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def load(offset):
+            client = Client(target, headers, options['timeout'])
+            mine = []
+            failed = 0
+            index = offset
+            while time.perf_counter() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                start = time.perf_counter()
+                status = client.get(path)
+                if status == 200:
+                    mine.append((time.perf_counter() - start) * 1000)
+                else:
+                    failed += 1
+            client.close()
+            with lock:
+                timings.extend(mine)
+                errors.append(failed)
+
+        start = time.perf_counter()
+        threads = [
+        threading.Thread(target=load, args=(offset,), daemon=True)
+        for offset in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+        result = summarize(timings) if timings else {'runs': 0}
+        result['errors'] = sum(errors)
+        result['requests_per_second'] = round(len(timings) / seconds, 1)
+        self.stderr.write(
+        'concurrency %5s  %8s req/s  median %8s ms  p99 %8s ms  errors %s' % (
+        concurrency, result['requests_per_second'], result.get('median_ms'),
+        result.get('p99_ms'), result['errors']
+        ))
+        return result
+
+
+    def compare(self, path, results):
+        with open(path) as stream:
+            previous = json.load(stream)['results']
+        for level, values in results.items():
+            before = previous.get(level, {})
+            for key in ('requests_per_second', 'median_ms', 'p99_ms'):
+                if key in values and before.get(key):
+                    change = (values[key] - before[key]) / before[key] * 100
+                    self.stderr.write(
+                    'concurrency %-6s %-20s %10s -> %10s  %+.1f %%'
+                    % (level, key, before[key], values[key], change)
+                    )
+
+
+class Client:
+    """
+    One keep-alive connection, returns the status or None on errors.
+    """
+
+    def __init__(self, target, headers, timeout):
+        Connection = (
+        http.client.HTTPSConnection if target.scheme == 'https'
+        else http.client.HTTPConnection
+        )
+        self.connection = Connection(target.hostname, target.port, timeout=timeout)
+        self.headers = headers
+
+    def get(self, path):
+        try:
+            self.connection.request('GET', path, headers=self.headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # reconnects on the next request
+            self.connection.close()
+            return None
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop import summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute aggregates of all catalogs from scratch.'
+
+    def handle(self, *args, **options):
+        count = summaries.rebuild()
+        self.stdout.write('%s catalog summaries built' % count)
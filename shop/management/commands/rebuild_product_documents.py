@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shop import documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild all materialized product documents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=documents.CHUNK_SIZE)
+        parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Number of threads building chunks in parallel.'
+        )
+
+
+    def handle(self, *args, **options):
+        count = documents.rebuild(
+        chunk_size=options['chunk_size'], workers=options['workers']
+        )
+        self.stdout.write('%s product documents built' % count)
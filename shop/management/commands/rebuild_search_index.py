@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = 'Recreate the product full-text index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+
+    def handle(self, *args, **options):
+        count = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write('%s products indexed' % count)
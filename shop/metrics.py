@@ -0,0 +1,120 @@
+"""
+Request metrics in the Prometheus text format.
+
+MetricsMiddleware observes every request, values are kept per process,
+so with several worker processes every scrape shows one of them (label
+the scrape target with the worker or run one process per container).
+"""
+import threading
+
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1000, 10000, 100000, 1000000, 10000000)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+    '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+    for name, value in labels
+    )
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield self.name, key, value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for key, counts in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + '_bucket', key + (('le', bound),), count
+            yield self.name + '_bucket', key + (('le', '+Inf'),), counts[-2]
+            yield self.name + '_count', key, counts[-2]
+            yield self.name + '_sum', key, counts[-1]
+
+
+requests_total = Counter(
+'shop_requests_total', 'Requests by view and status code.'
+)
+request_seconds = Histogram(
+'shop_request_duration_seconds', 'Time spent in the request.', TIME_BUCKETS
+)
+query_count = Histogram(
+'shop_request_queries', 'Database queries per request.', QUERY_BUCKETS
+)
+query_seconds = Histogram(
+'shop_request_query_seconds', 'Time spent in database queries per request.',
+TIME_BUCKETS
+)
+render_seconds = Histogram(
+'shop_request_render_seconds', 'Time spent rendering the response.',
+TIME_BUCKETS
+)
+response_bytes = Histogram(
+'shop_response_bytes', 'Size of non-streaming responses.', SIZE_BUCKETS
+)
+query_alarms = Counter(
+'shop_query_alarms_total', 'Requests over SHOP_QUERY_ALARM queries.'
+)
+
+METRICS = [
+requests_total, request_seconds, query_count, query_seconds, render_seconds,
+response_bytes, query_alarms,
+]
+
+
+def exposition():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.append('# HELP %s %s' % (metric.name, metric.help))
+        lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+        for name, labels, value in metric.samples():
+            lines.append('%s%s %s' % (name, format_labels(labels), value))
+    return '\n'.join(lines) + '\n'
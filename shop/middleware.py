@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import time
+import zlib
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger('shop.metrics')
+
+# query logs of the current request, async views run their queries in
+# other threads and take the context along
+query_logs = ContextVar('shop_query_logs', default=())
+
+
+def dispatch_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper of every connection, passes queries through the
+    query logs of the current request.
+    """
+    for log in query_logs.get():
+        execute = partial(log, execute)
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    if dispatch_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(dispatch_queries)
+
+
+class QueryLog:
+    """
+    Database execute wrapper counting and timing queries. keep_sql keeps
+    every statement, count_sql only counts repeats of up to max_sql
+    distinct statements, so memory stays flat over long requests.
+    """
+
+    max_sql = 1000
+
+    def __init__(self, keep_sql=False, count_sql=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+        self.count_sql = count_sql
+        self.repeated = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.seconds += duration
+            if self.keep_sql:
+                self.statements.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': repr(params)[:1000],
+                'many': many,
+                'ms': round(duration * 1000, 3),
+                })
+            if self.count_sql and (
+            sql in self.repeated or len(self.repeated) < self.max_sql
+            ):
+                self.repeated[sql] += 1
+
+    def wrap(self, stack):
+        """
+        Log queries of the current request until `stack` closes. Connections
+        made later get the wrapper from the connection_created signal.
+        """
+        for connection in connections.all():
+            install(connection)
+        token = query_logs.set(query_logs.get() + (self,))
+        stack.callback(query_logs.reset, token)
+
+
+def view_class(view_func):
+    """
+    Class of a view made by as_view(), Django or DRF, None for functions.
+    """
+    return getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+
+
+def view_name(view_func):
+    cls = view_class(view_func)
+    if cls is not None:
+        return cls.__name__
+    return getattr(view_func, '__name__', 'unknown')
+
+
+class MetricsMiddleware:
+    """
+    Records view, query count and time, render time and size of every
+    request into shop.metrics and logs requests over SHOP_QUERY_ALARM
+    queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # tells the handler to await this middleware, as MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        queries = self.start(request)
+        with ExitStack() as stack:
+            queries.wrap(stack)
+            response = self.get_response(request)
+        return self.finish(request, response, queries)
+
+
+    async def __acall__(self, request):
+        queries = self.start(request)
+        with ExitStack() as stack:
+            queries.wrap(stack)
+            response = await self.get_response(request)
+        return self.finish(request, response, queries)
+
+
+    def start(self, request):
+        request._metrics_view = 'unresolved'
+        request._metrics_render = 0.0
+        request._metrics_start = time.perf_counter()
+        return QueryLog(
+        count_sql=getattr(settings, 'SHOP_QUERY_ALARM', None) is not None
+        )
+
+
+    def finish(self, request, response, queries):
+        alarm = getattr(settings, 'SHOP_QUERY_ALARM', None)
+        duration = time.perf_counter() - request._metrics_start
+        view = request._metrics_view
+        metrics.requests_total.inc(view=view, status=response.status_code)
+        metrics.request_seconds.observe(duration, view=view)
+        metrics.query_count.observe(queries.count, view=view)
+        metrics.query_seconds.observe(queries.seconds, view=view)
+        metrics.render_seconds.observe(request._metrics_render, view=view)
+        if not response.streaming:
+            metrics.response_bytes.observe(len(response.content), view=view)
+
+        if alarm is not None and queries.count > alarm:
+            metrics.query_alarms.inc(view=view)
+            sql, times = queries.repeated.most_common(1)[0]
+            logger.warning(
+            '%s queries (%.1f ms) in %s %s, most repeated (%sx): %s',
+            queries.count, queries.seconds * 1000, view, request.get_full_path(),
+            times, sql[:500],
+            )
+        return response
+
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_name(view_func)
+
+
+    def process_template_response(self, request, response):
+        if response.is_rendered:
+            # rendered by an async view, which timed it
+            return response
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def accepted_encoding(header):
+    """
+    Content coding for an Accept-Encoding header, br before gzip on equal
+    weight, None for identity.
+    """
+    weights = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    choices = [
+    (weights.get(coding, weights.get('*', 0.0)), -index, coding)
+    for index, coding in enumerate(supported)
+    ]
+    weight, index, coding = max(choices)
+    return coding if weight > 0 else None
+
+
+def compressor(coding):
+    """
+    (compress, finish) functions of a new compression stream.
+    """
+    if coding == 'br':
+        stream = brotli.Compressor(quality=getattr(settings, 'SHOP_BROTLI_QUALITY', 5))
+        return stream.process, stream.finish
+    # wbits 31 writes the gzip header and trailer
+    stream = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return stream.compress, stream.flush
+
+
+def compress_chunks(chunks, coding):
+    compress, finish = compressor(coding)
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def acompress_chunks(chunks, coding):
+    compress, finish = compressor(coding)
+    async for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of SHOP_COMPRESS_TYPES with gzip, or brotli if
+    the package is installed and the client takes it. Only streamed
+    responses (exports) and ones over SHOP_COMPRESS_MIN_SIZE bytes
+    (lists) are compressed. HTML is not in the default types, compressing
+    pages with CSRF tokens opens them to BREACH.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+
+    def compressible(self, response):
+        if response.status_code == 304 or response.has_header('Content-Encoding'):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in getattr(settings, 'SHOP_COMPRESS_TYPES', []):
+            return False
+        if response.streaming:
+            return True
+        return len(response.content) >= getattr(settings, 'SHOP_COMPRESS_MIN_SIZE', 1024)
+
+
+    def compress(self, request, response):
+        if not self.compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if getattr(response, 'is_async', False):
+                response.streaming_content = acompress_chunks(
+                response.streaming_content, coding
+                )
+            else:
+                response.streaming_content = compress_chunks(
+                response.streaming_content, coding
+                )
+            del response['Content-Length']
+        else:
+            content = b''.join(compress_chunks([response.content], coding))
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # the body differs byte for byte from the uncompressed one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_auto_20210510_1459'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.CharField(max_length=400, verbose_name='Soubor s daty')),
+                ('status', models.CharField(choices=[('queued', 'Ve fronte'), ('running', 'Bezi'), ('done', 'Hotovo'), ('failed', 'Chyba')], db_index=True, default='queued', max_length=10, verbose_name='Stav')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Zpracovano zaznamu')),
+                ('summary', models.JSONField(blank=True, default=dict, verbose_name='Vysledek')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Chyba')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Vytvoreno')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Spusteno')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Dokonceno')),
+                ('heartbeat', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('record_id', models.IntegerField()),
+                ('hash', models.CharField(max_length=40)),
+            ],
+            options={
+                'unique_together': {('model', 'record_id')},
+            },
+        ),
+    ]
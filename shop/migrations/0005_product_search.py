@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from shop.search import get_backend
+
+    backend = get_backend(schema_editor.connection)
+    if backend is None:
+        return
+    Product = apps.get_model('shop', 'Product')
+    products = Product.objects.using(schema_editor.connection.alias).order_by('id')
+    with schema_editor.connection.cursor() as cursor:
+        backend.create(cursor)
+        last = 0
+        while True:
+            rows = list(
+            products.filter(id__gt=last).values_list(
+            'id', 'nazev', 'description'
+            )[:1000]
+            )
+            if not rows:
+                break
+            backend.index(cursor, rows)
+            last = rows[-1][0]
+
+
+def drop_index(apps, schema_editor):
+    from shop.search import get_backend
+
+    backend = get_backend(schema_editor.connection)
+    if backend is not None:
+        with schema_editor.connection.cursor() as cursor:
+            backend.drop(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_recordhash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
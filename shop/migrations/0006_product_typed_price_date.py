@@ -0,0 +1,103 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:44
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+# copies of shop.models.parse_price and parse_published, the migration
+# must not change when the models do
+def parse_price(value):
+    if value in (None, ''):
+        return None
+    value = str(value).replace(' ', '').replace('\xa0', '').replace(',', '.')
+    try:
+        price = Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+    if not price.is_finite() or abs(price) >= Decimal('1e12'):
+        return None
+    return price
+
+
+def parse_published(value):
+    if not value:
+        return None
+    try:
+        result = parse_datetime(value)
+        if result is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            result = timezone.datetime(day.year, day.month, day.day)
+    except ValueError:
+        return None
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result, timezone.utc)
+    return result
+
+
+def backfill(apps, schema_editor):
+    """
+    Parse cena and published_on in chunks, each chunk is committed alone
+    so big tables aren't locked for the whole run.
+    """
+    Product = apps.get_model('shop', 'Product')
+    alias = schema_editor.connection.alias
+    products = Product.objects.using(alias).order_by('id')
+    last = 0
+    while True:
+        with transaction.atomic(using=alias):
+            chunk = list(
+            products.filter(id__gt=last).only('id', 'cena', 'published_on')[:2000]
+            )
+            if not chunk:
+                return
+            for product in chunk:
+                product.cena_decimal = parse_price(product.cena)
+                product.published_at = parse_published(product.published_on)
+            Product.objects.using(alias).bulk_update(
+            chunk, ['cena_decimal', 'published_at']
+            )
+        last = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('shop', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mena', models.CharField(choices=[('CZK', 'CZK'), ('EUR', 'EUR')], max_length=3, unique=True, verbose_name='Mena')),
+                ('kurz', models.DecimalField(decimal_places=6, max_digits=12, verbose_name='Kurz k CZK')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='cena_decimal',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True, verbose_name='Cena (cislo)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='published_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Publikovano (datum)'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_published', 'published_at'], name='product_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['mena', 'cena_decimal'], name='product_price_idx'),
+        ),
+    ]
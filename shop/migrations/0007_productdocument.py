@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:48
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_typed_price_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='shop.product')),
+                ('document', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Aktualizovano')),
+            ],
+        ),
+    ]
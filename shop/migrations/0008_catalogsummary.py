@@ -0,0 +1,26 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_productdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSummary',
+            fields=[
+                ('catalog', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='shop.catalog')),
+                ('product_count', models.PositiveIntegerField(default=0, verbose_name='Pocet produktu')),
+                ('published_count', models.PositiveIntegerField(default=0, verbose_name='Pocet publikovanych')),
+                ('cena_min', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='Nejnizsi cena')),
+                ('cena_max', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='Nejvyssi cena')),
+                ('facets', models.JSONField(blank=True, default=list, verbose_name='Fasety')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Aktualizovano')),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_catalogsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attributename',
+            index=models.Index(fields=['kod'], name='attrname_kod_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attributename',
+            index=models.Index(fields=['nazev'], name='attrname_nazev_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attributevalue',
+            index=models.Index(fields=['hodnota'], name='attrvalue_hodnota_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['obrazek'], name='image_obrazek_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['nazev'], name='product_nazev_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(is_published=True), fields=['id'], name='product_published_id_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:53
+
+from django.db import migrations, models, transaction
+
+
+def remove_duplicates(model, fields):
+    """
+    Keep the oldest row of every group with the same values of `fields`,
+    duplicates are deleted in committed batches.
+    """
+
+    def run(apps, schema_editor):
+        Model = apps.get_model('shop', model)
+        alias = schema_editor.connection.alias
+        rows = Model.objects.using(alias).filter(
+        **{field + '__isnull': False for field in fields}
+        ).order_by(*fields, 'id').values_list('id', *fields)
+
+        duplicates = []
+        previous = None
+        for row in rows.iterator(chunk_size=5000):
+            if row[1:] == previous:
+                duplicates.append(row[0])
+            previous = row[1:]
+        for start in range(0, len(duplicates), 1000):
+            with transaction.atomic(using=alias):
+                Model.objects.using(alias).filter(
+                id__in=duplicates[start:start + 1000]
+                ).delete()
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('shop', '0009_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicates('ProductAttributes', ['product', 'attribute']),
+            migrations.RunPython.noop,
+        ),
+        migrations.RunPython(
+            remove_duplicates('ProductImage', ['product', 'obrazek_id']),
+            migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='productattributes',
+            constraint=models.UniqueConstraint(fields=('product', 'attribute'), name='product_attribute_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(fields=('product', 'obrazek_id'), name='product_image_unique'),
+        ),
+    ]
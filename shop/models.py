@@ -1,7 +1,54 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 # Create your models here.
 
+PRICE_STEP = Decimal('0.01')
+PRICE_LIMIT = Decimal('1e12')
+
+
+def parse_price(value):
+    """
+    '21 566,50' -> Decimal('21566.50'), None when it isn't a number or
+    doesn't fit cena_decimal.
+    """
+    if value in (None, ''):
+        return None
+    value = str(value).replace(' ', '').replace('\xa0', '').replace(',', '.')
+    try:
+        price = Decimal(value).quantize(PRICE_STEP)
+    except InvalidOperation:
+        return None
+    # cena_decimal holds 14 digits, larger prices can't be saved
+    if not price.is_finite() or abs(price) >= PRICE_LIMIT:
+        return None
+    return price
+
+
+def parse_published(value):
+    """
+    ISO date or datetime text -> aware datetime, None when unparsable.
+    """
+    if not value:
+        return None
+    try:
+        result = parse_datetime(value)
+        if result is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            result = timezone.datetime(day.year, day.month, day.day)
+    except ValueError:
+        return None
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result, timezone.utc)
+    return result
+
+
 class AttributeName(models.Model):
     nazev = models.CharField(
     max_length=200, null=True, blank=True, verbose_name="Nazev atributu"
@@ -13,6 +60,15 @@ class AttributeName(models.Model):
     blank=True, default=False, verbose_name="Zobrazen"
     )
 
+    # columns read by __str__, list pages load only these
+    display_fields = ['nazev']
+
+    class Meta:
+        indexes = [
+        models.Index(fields=['kod'], name='attrname_kod_idx'),
+        models.Index(fields=['nazev'], name='attrname_nazev_idx'),
+        ]
+
     def __str__(self):
         return self.nazev
 
@@ -20,6 +76,13 @@ class AttributeName(models.Model):
 class AttributeValue(models.Model):
     hodnota = models.CharField(max_length=200, null=True, blank=True)
 
+    display_fields = ['hodnota']
+
+    class Meta:
+        indexes = [
+        models.Index(fields=['hodnota'], name='attrvalue_hodnota_idx'),
+        ]
+
     def __str__(self):
         return self.hodnota
 
@@ -38,6 +101,11 @@ class Image(models.Model):
     max_length=400, null=True, blank=True, verbose_name="Link obrazku"
     )
 
+    class Meta:
+        indexes = [
+        models.Index(fields=['obrazek'], name='image_obrazek_idx'),
+        ]
+
 
 class Product(models.Model):
     CURRENCY = (
@@ -64,10 +132,50 @@ class Product(models.Model):
     is_published = models.BooleanField(
     blank=True, default=False, verbose_name="Publikovano"
     )
+    # typed copies of cena and published_on for sorting and range filters
+    cena_decimal = models.DecimalField(
+    max_digits=14, decimal_places=2, null=True, blank=True, editable=False,
+    verbose_name="Cena (cislo)"
+    )
+    published_at = models.DateTimeField(
+    null=True, blank=True, editable=False, verbose_name="Publikovano (datum)"
+    )
+
+    # text field -> typed field kept in sync with it
+    typed_fields = {'cena': 'cena_decimal', 'published_on': 'published_at'}
+    display_fields = ['nazev']
+
+    class Meta:
+        indexes = [
+        models.Index(
+        fields=['is_published', 'published_at'], name='product_published_idx'
+        ),
+        models.Index(fields=['mena', 'cena_decimal'], name='product_price_idx'),
+        models.Index(fields=['nazev'], name='product_nazev_idx'),
+        # listing of published products by id, the index skips the rest
+        models.Index(
+        fields=['id'], name='product_published_id_idx',
+        condition=models.Q(is_published=True)
+        ),
+        ]
 
     def __str__(self):
         return (self.nazev)
 
+    def sync_typed_fields(self):
+        self.cena_decimal = parse_price(self.cena)
+        self.published_at = parse_published(self.published_on)
+
+    def save(self, *args, **kwargs):
+        self.sync_typed_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+            self.typed_fields[name] for name in update_fields
+            if name in self.typed_fields
+            }
+        super().save(*args, **kwargs)
+
 
 class ProductAttributes(models.Model):
     attribute = models.ForeignKey(
@@ -77,6 +185,13 @@ class ProductAttributes(models.Model):
     Product, null=True, on_delete=models.SET_NULL,
     )
 
+    class Meta:
+        constraints = [
+        models.UniqueConstraint(
+        fields=['product', 'attribute'], name='product_attribute_unique'
+        ),
+        ]
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(
@@ -89,6 +204,13 @@ class ProductImage(models.Model):
     max_length=200, null=True, blank=True, verbose_name="Nazev obrazku"
     )
 
+    class Meta:
+        constraints = [
+        models.UniqueConstraint(
+        fields=['product', 'obrazek_id'], name='product_image_unique'
+        ),
+        ]
+
 
 class Catalog(models.Model):
     nazev = models.CharField(
@@ -99,3 +221,116 @@ class Catalog(models.Model):
     )
     products_ids = models.ManyToManyField(Product, blank=True)
     attributes_ids = models.ManyToManyField(Attribute, blank=True)
+
+
+class ProductDocument(models.Model):
+    """
+    Fully assembled product as returned by the API, rebuilt when any of
+    its parts changes.
+    """
+    product = models.OneToOneField(
+    Product, primary_key=True, on_delete=models.CASCADE,
+    related_name='document'
+    )
+    document = models.JSONField(encoder=DjangoJSONEncoder)
+    updated = models.DateTimeField(auto_now=True, verbose_name="Aktualizovano")
+
+
+class CatalogSummary(models.Model):
+    """
+    Aggregates over the products of a catalog, prices are in CZK.
+    """
+    catalog = models.OneToOneField(
+    Catalog, primary_key=True, on_delete=models.CASCADE,
+    related_name='summary'
+    )
+    product_count = models.PositiveIntegerField(
+    default=0, verbose_name="Pocet produktu"
+    )
+    published_count = models.PositiveIntegerField(
+    default=0, verbose_name="Pocet publikovanych"
+    )
+    cena_min = models.DecimalField(
+    max_digits=20, decimal_places=2, null=True, blank=True,
+    verbose_name="Nejnizsi cena"
+    )
+    cena_max = models.DecimalField(
+    max_digits=20, decimal_places=2, null=True, blank=True,
+    verbose_name="Nejvyssi cena"
+    )
+    facets = models.JSONField(default=list, blank=True, verbose_name="Fasety")
+    updated = models.DateTimeField(auto_now=True, verbose_name="Aktualizovano")
+
+
+class ImportJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS = (
+    (QUEUED, 'Ve fronte'),
+    (RUNNING, 'Bezi'),
+    (DONE, 'Hotovo'),
+    (FAILED, 'Chyba'),
+    )
+
+    payload = models.CharField(
+    max_length=400, verbose_name="Soubor s daty"
+    )
+    status = models.CharField(
+    max_length=10, choices=STATUS, default=QUEUED, db_index=True,
+    verbose_name="Stav"
+    )
+    processed = models.PositiveIntegerField(
+    default=0, verbose_name="Zpracovano zaznamu"
+    )
+    summary = models.JSONField(default=dict, blank=True, verbose_name="Vysledek")
+    error = models.TextField(null=True, blank=True, verbose_name="Chyba")
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Vytvoreno")
+    started = models.DateTimeField(null=True, blank=True, verbose_name="Spusteno")
+    finished = models.DateTimeField(
+    null=True, blank=True, verbose_name="Dokonceno"
+    )
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    display_fields = ['status']
+
+    def __str__(self):
+        return 'Import %s (%s)' % (self.pk, self.status)
+
+
+class RecordHash(models.Model):
+    """
+    Content hash of the last imported version of a record.
+    """
+    model = models.CharField(max_length=50)
+    record_id = models.IntegerField()
+    hash = models.CharField(max_length=40)
+
+    class Meta:
+        unique_together = [('model', 'record_id')]
+
+
+class IndexVersion(models.Model):
+    """
+    Version of an in-memory index, every process compares its copy to it.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveIntegerField(default=0)
+
+
+class CurrencyRate(models.Model):
+    """
+    Price of one unit of the currency in CZK.
+    """
+    mena = models.CharField(
+    max_length=3, unique=True, choices=Product.CURRENCY, verbose_name="Mena"
+    )
+    kurz = models.DecimalField(
+    max_digits=12, decimal_places=6, verbose_name="Kurz k CZK"
+    )
+
+    display_fields = ['mena', 'kurz']
+
+    def __str__(self):
+        return '%s %s' % (self.mena, self.kurz)
@@ -0,0 +1,20 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class AvailableContentNegotiation(DefaultContentNegotiation):
+    """
+    Skips parsers and renderers whose optional package is not installed
+    (`available = False`), asking for them gets 415 or 406.
+    """
+
+    def select_parser(self, request, parsers):
+        return super().select_parser(
+        request, [parser for parser in parsers if getattr(parser, 'available', True)]
+        )
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return super().select_renderer(
+        request,
+        [renderer for renderer in renderers if getattr(renderer, 'available', True)],
+        format_suffix
+        )
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db import connections, router
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def page_size():
+    return getattr(settings, 'SHOP_PAGE_SIZE', 50)
+
+
+def parse_cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def estimated_count(Model):
+    """
+    Row count of the whole table. Postgres statistics are used for big
+    tables instead of COUNT(*), which has to scan all rows.
+    """
+    alias = router.db_for_read(Model)
+    connection = connections[alias]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [Model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        minimum = getattr(settings, 'SHOP_ESTIMATED_COUNT_MIN', 100000)
+        if row and row[0] >= minimum:
+            return int(row[0])
+    return Model._default_manager.using(alias).count()
+
+
+class KeysetPage:
+    """
+    Page of rows ordered by primary key, following rows are read with
+    `pk > next` so deep pages cost the same as the first one.
+    """
+
+    def __init__(self, queryset, after=None, size=None):
+        size = size or page_size()
+        queryset = queryset.order_by('pk')
+        after = parse_cursor(after)
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        rows = list(queryset[:size + 1])
+        self.rows = rows[:size]
+        self.next = self.rows[-1].pk if len(rows) > size else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def next_query(self, request):
+        """
+        Query string of the next page, other parameters are kept.
+        """
+        if self.next is None:
+            return None
+        params = request.GET.copy()
+        params['after'] = self.next
+        return params.urlencode()
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on id with an estimated total count. The estimate is
+    for the whole table, filtered lists have no count.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_page_size(self, request):
+        self.page_size = page_size()
+        return super().get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if not queryset.query.where:
+            self.count = estimated_count(queryset.model)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+        'count': self.count,
+        'next': self.get_next_link(),
+        'previous': self.get_previous_link(),
+        'results': data,
+        })
+
+
+class DocumentCursorPagination(IdCursorPagination):
+    ordering = 'product_id'
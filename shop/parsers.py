@@ -0,0 +1,227 @@
+import codecs
+import io
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+READ_SIZE = 64 * 1024
+
+
+def fast_json(encoding):
+    # orjson only reads UTF-8
+    return orjson is not None and codecs.lookup(encoding).name == 'utf-8'
+
+
+def content_length(parser_context):
+    request = parser_context.get('request')
+    try:
+        return int(request.META.get('CONTENT_LENGTH'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def iter_records(stream, encoding='utf-8'):
+    """
+    Yield records from a JSON array or from NDJSON one at a time.
+
+    Only the record being decoded is kept in memory, so the size of the
+    input does not matter.
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder(encoding)()
+    buf = ''
+    pos = 0
+    eof = False
+    in_array = None
+
+    def fill(buf, pos):
+        chunk = stream.read(READ_SIZE)
+        if isinstance(chunk, str):
+            chunk = chunk.encode(encoding)
+        return buf[pos:] + reader.decode(chunk, final=not chunk), 0, not chunk
+
+    while True:
+        # skip whitespace and separators between records
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos, eof = fill(buf, pos)
+
+        if pos >= len(buf):
+            if in_array:
+                raise ValueError('Unterminated JSON array.')
+            return
+
+        char = buf[pos]
+        if in_array is None:
+            in_array = char == '['
+            if in_array:
+                pos += 1
+                continue
+        elif in_array and char in ',]':
+            pos += 1
+            if char == ']':
+                in_array = False
+            continue
+        elif in_array is False and char == ']':
+            raise ValueError('Unexpected "]" at position %s.' % pos)
+
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            buf, pos, eof = fill(buf, pos)
+            continue
+        pos = end
+        yield record
+
+
+def iter_lines(stream):
+    """
+    Yield records of NDJSON, one per line, decoded by orjson.
+    """
+    for number, line in enumerate(iter(stream.readline, b''), 1):
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            raise ValueError('line %s: %s' % (number, exc))
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser on orjson, the stdlib one is used without orjson.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not fast_json(encoding):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class StreamingJSONParser(BaseParser):
+    """
+    Parses JSON array lazily, request.data is an iterator of records.
+    Payloads up to SHOP_JSON_IN_MEMORY_MAX bytes are parsed at once by
+    orjson, which is several times faster than decoding record by record.
+    """
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if stream is None:
+            return iter(())
+        length = content_length(parser_context)
+        limit = getattr(settings, 'SHOP_JSON_IN_MEMORY_MAX', 16 * 1024 * 1024)
+        if fast_json(encoding) and length is not None and length <= limit:
+            return self.loaded(stream, encoding)
+        return self.records(stream, encoding)
+
+
+    def records(self, stream, encoding):
+        try:
+            yield from iter_records(stream, encoding)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+    def loaded(self, stream, encoding):
+        body = stream.read()
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # e.g. NDJSON sent as application/json, read as before
+            yield from self.records(io.BytesIO(body), encoding)
+            return
+        yield from data if isinstance(data, list) else [data]
+
+
+class NDJSONParser(StreamingJSONParser):
+    """
+    Parses newline delimited JSON, one record per line.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if stream is None:
+            return iter(())
+        if fast_json(encoding):
+            return self.lines(stream)
+        return self.records(stream, encoding)
+
+
+    def lines(self, stream):
+        try:
+            yield from iter_lines(stream)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackParser(BaseParser):
+    """
+    One MessagePack object, needs the msgpack package.
+    """
+    media_type = 'application/msgpack'
+    available = msgpack is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
+
+
+class StreamingMessagePackParser(MessagePackParser):
+    """
+    Parses a MessagePack array of records, or records packed one after
+    another like NDJSON lines, lazily. request.data is an iterator of records.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        return self.records(stream)
+
+
+    def records(self, stream):
+        unpacker = msgpack.Unpacker(stream, raw=False)
+        try:
+            try:
+                count = unpacker.read_array_header()
+            except msgpack.OutOfData:
+                return
+            except ValueError:
+                # not an array, a stream of records
+                yield from unpacker
+                return
+            for i in range(count):
+                yield unpacker.unpack()
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
@@ -0,0 +1,255 @@
+"""
+On-demand profiles of single requests.
+
+With SHOP_PROFILING on, a staff user gets a profile of a request by
+sending the `X-Shop-Profile: 1` header or `?_profile=1`. The request runs
+under cProfile and a stack sampler, SHOP_PROFILE_DIR then holds for
+every profile:
+
+    <name>.prof        pstats, `python -m pstats` or snakeviz
+    <name>.collapsed   sampled stacks for flamegraph.pl / speedscope
+    <name>.json        request info and its SQL log
+"""
+import asyncio
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .middleware import QueryLog, view_name
+
+
+NAME = re.compile(r'^[\w.-]+$')
+# `?_profile=0` or an empty header asks for nothing
+ASKED_VALUES = {'1', 'true', 'yes', 'on'}
+
+# profile and sampler of the current async request
+active = ContextVar('shop_profile', default=None)
+
+
+def profile_dir():
+    return Path(getattr(settings, 'SHOP_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of another thread every `interval` seconds.
+    """
+
+    def __init__(self, thread_id, interval):
+        # thread_id None samples nothing, follow() sets it
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id) if self.thread_id else None
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%s)' % (
+                code.co_name, os.path.basename(code.co_filename), code.co_firstlineno
+                ))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(
+        '%s %s\n' % (stack, count) for stack, count in self.stacks.most_common()
+        )
+
+
+@contextmanager
+def follow():
+    """
+    Profile the current thread while the block runs, if the async request
+    it works for is profiled.
+    """
+    current = active.get()
+    if current is None:
+        yield
+        return
+    profile, sampler = current
+    sampler.thread_id = threading.get_ident()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        sampler.thread_id = None
+
+
+def save(request, response, profile, sampler, queries, duration):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    view = getattr(request, '_profile_view', 'unresolved')
+    name = '%s-%s-%s' % (
+    timezone.now().strftime('%Y%m%d-%H%M%S-%f'), view, uuid.uuid4().hex[:6]
+    )
+    profile.dump_stats(str(directory / (name + '.prof')))
+    (directory / (name + '.collapsed')).write_text(sampler.collapsed())
+    info = {
+    'name': name,
+    'created': timezone.now().isoformat(),
+    'method': request.method,
+    'path': request.get_full_path(),
+    'view': view,
+    'user': request._profile_user,
+    'status': response.status_code,
+    'ms': round(duration * 1000, 3),
+    'query_count': queries.count,
+    'query_ms': round(queries.seconds * 1000, 3),
+    'queries': queries.statements,
+    }
+    (directory / (name + '.json')).write_text(json.dumps(info, indent=2))
+    prune(directory)
+    return name
+
+
+def prune(directory):
+    """
+    Keep only the newest SHOP_PROFILE_KEEP profiles.
+    """
+    keep = getattr(settings, 'SHOP_PROFILE_KEEP', 100)
+    names = sorted(path.stem for path in directory.glob('*.json'))
+    for name in names[:max(len(names) - keep, 0)]:
+        for suffix in ('.prof', '.collapsed', '.json'):
+            try:
+                (directory / (name + suffix)).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def profiles():
+    """
+    Saved profiles, newest first, without their SQL logs.
+    """
+    found = []
+    directory = profile_dir()
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        try:
+            info = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        info.pop('queries', None)
+        found.append(info)
+    return found
+
+
+def profile_file(name):
+    """
+    Path of a saved profile file, None for anything else.
+    """
+    if not NAME.match(name) or not name.endswith(('.prof', '.collapsed', '.json')):
+        return None
+    path = profile_dir() / name
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests asked for by staff users, see the module docstring.
+    Has to come after AuthenticationMiddleware. Async requests are profiled
+    in the pool threads their views run in (see follow()), not in the
+    event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+    def asked(self, request):
+        if not getattr(settings, 'SHOP_PROFILING', False):
+            return False
+        value = request.META.get('HTTP_X_SHOP_PROFILE') or request.GET.get('_profile')
+        return str(value).lower() in ASKED_VALUES
+
+
+    def allowed(self, request):
+        # DRF views replace request.user with the user of their own
+        # authentication, the name is kept for save()
+        request._profile_user = request.user.get_username()
+        return request.user.is_staff
+
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not (self.asked(request) and self.allowed(request)):
+            return self.get_response(request)
+
+        profile = cProfile.Profile()
+        sampler = StackSampler(
+        threading.get_ident(), getattr(settings, 'SHOP_PROFILE_INTERVAL', 0.005)
+        )
+        queries = QueryLog(keep_sql=True)
+        sampler.start()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            queries.wrap(stack)
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+                sampler.stop()
+        duration = time.perf_counter() - start
+
+        response['X-Shop-Profile'] = save(
+        request, response, profile, sampler, queries, duration
+        )
+        return response
+
+
+    async def __acall__(self, request):
+        # request.user may need a query, not allowed in the event loop
+        if not (self.asked(request) and await sync_to_async(self.allowed)(request)):
+            return await self.get_response(request)
+
+        profile = cProfile.Profile()
+        sampler = StackSampler(None, getattr(settings, 'SHOP_PROFILE_INTERVAL', 0.005))
+        queries = QueryLog(keep_sql=True)
+        sampler.start()
+        start = time.perf_counter()
+        token = active.set((profile, sampler))
+        with ExitStack() as stack:
+            queries.wrap(stack)
+            try:
+                response = await self.get_response(request)
+            finally:
+                active.reset(token)
+                sampler.stop()
+        duration = time.perf_counter() - start
+
+        response['X-Shop-Profile'] = await sync_to_async(save)(
+        request, response, profile, sampler, queries, duration
+        )
+        return response
+
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profile_view = view_name(view_func)
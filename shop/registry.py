@@ -0,0 +1,100 @@
+"""
+Metadata of shop models for the generic record views.
+
+Built once in ShopConfig.ready(), so requests don't introspect models.
+Models are looked up by name case-insensitively like apps.get_model().
+Only catalog models the importer knows and their many-to-many tables are
+registered, internal ones (jobs, hashes, documents...) are not exposed.
+"""
+from django.apps import apps
+from django.db import models as db_models
+
+from .importer import import_order
+
+
+class ModelInfo:
+
+    def __init__(self, Model):
+        opts = Model._meta
+        self.model = Model
+        self.name = Model.__name__
+        self.label = opts.model_name
+        self.fields = list(opts.concrete_fields)
+        self.many_to_many = list(opts.many_to_many)
+        self.display_columns = self.find_display_columns(Model)
+        # list pages only need what __str__ reads
+        self.list_columns = [opts.pk.name] + [
+        name for name in self.display_columns if name != opts.pk.name
+        ]
+        self.select_related = [
+        field.name for field in self.fields if field.is_relation
+        ]
+        self.prefetch_related = [field.name for field in self.many_to_many]
+        # models whose rows are shown on the detail page
+        self.detail_models = [self.name] + sorted({
+        field.related_model.__name__
+        for field in self.fields + self.many_to_many if field.is_relation
+        })
+
+
+    @staticmethod
+    def find_display_columns(Model):
+        if Model.__str__ is db_models.Model.__str__:
+            return []
+        columns = getattr(Model, 'display_fields', None)
+        if columns is None:
+            return [field.name for field in Model._meta.concrete_fields]
+        return list(columns)
+
+
+    def list_queryset(self):
+        return self.model._default_manager.only(*self.list_columns)
+
+
+    def detail_queryset(self):
+        queryset = self.model._default_manager.all()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+
+    def values(self, record):
+        """
+        (verbose name, value) of every field of a record.
+        """
+        values = [
+        (field.verbose_name, getattr(record, field.name)) for field in self.fields
+        ]
+        values += [
+        (
+        field.verbose_name,
+        ', '.join(str(item) for item in getattr(record, field.name).all())
+        )
+        for field in self.many_to_many
+        ]
+        return values
+
+
+models = {}
+
+
+def build():
+    models.clear()
+    for name in import_order:
+        Model = apps.get_model('shop', name)
+        through = [
+        field.remote_field.through for field in Model._meta.many_to_many
+        if field.remote_field.through._meta.auto_created
+        ]
+        for Model in [Model] + through:
+            info = ModelInfo(Model)
+            models[info.label] = info
+
+
+def get(name):
+    """
+    ModelInfo of a model name, None for unknown models.
+    """
+    return models.get(str(name).lower())
@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+from itertools import chain
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# types orjson and msgpack do not know are converted like the stdlib
+# encoders do, datetimes included so the output stays the same
+api_default = JSONEncoder().default
+record_default = DjangoJSONEncoder().default
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson, the stdlib one is used without orjson.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        option = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        content = orjson.dumps(data, default=api_default, option=option)
+        # escaped like JSONRenderer does, for JSON embedded in scripts
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+        b'\xe2\x80\xa9', b'\\u2029'
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack for machine clients, needs the msgpack package.
+    `lines()` streams one object per record, the import reads such a
+    stream the way it reads NDJSON.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def packer(self):
+        return msgpack.Packer(default=record_default, use_bin_type=True)
+
+    def lines(self, records):
+        packer = self.packer()
+        for record in records:
+            yield packer.pack(record)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.packer().pack(data)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    One JSON document per line, `lines()` is used for streaming.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def lines(self, records):
+        if orjson is not None:
+            option = ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE
+            for record in records:
+                yield orjson.dumps(record, default=record_default, option=option)
+            return
+        for record in records:
+            yield (
+            json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+            ).encode(self.charset)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = [data]
+        return b''.join(self.lines(data))
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Rows of flat dicts, list values are joined with commas.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def lines(self, rows, header=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def line(values):
+            writer.writerow(values)
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return value.encode(self.charset)
+
+        rows = iter(rows)
+        if header is None:
+            first = next(rows, None)
+            if first is None:
+                return
+            header = list(first)
+            rows = chain([first], rows)
+        yield line(header)
+        for row in rows:
+            yield line([self.cell(row.get(name)) for name in header])
+
+    def cell(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, tuple)):
+            return ','.join(str(item) for item in value)
+        return value
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = [data]
+        return b''.join(self.lines(data))
@@ -0,0 +1,126 @@
+"""
+Database routing between the primary and read replicas.
+
+Views with `replica_reads = True` read from one of SHOP_DB_REPLICAS.
+Everything else, all writes, and auth and sessions use `default`. A
+write request (any unsafe method) sets a cookie that keeps the client on
+the primary for SHOP_DB_STICKY_SECONDS, so it reads its own writes while
+the replicas catch up.
+"""
+import asyncio
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .middleware import view_class
+
+
+STICKY_COOKIE = 'shop_primary'
+PRIMARY_APPS = {'admin', 'auth', 'contenttypes', 'sessions'}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Routing:
+    """
+    Database the current request reads from, None for the primary.
+    """
+
+    def __init__(self):
+        self.alias = None
+
+
+# async views read in pool threads, the context takes the routing along
+current = ContextVar('shop_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'SHOP_DB_REPLICAS', [])
+
+
+def reading_replica():
+    routing = current.get()
+    return routing is not None and routing.alias is not None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        routing = current.get()
+        return routing.alias if routing is not None else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaMiddleware:
+    """
+    Routes reads of replica views and sets the stickiness cookie.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = current.set(Routing())
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.stick(request, response)
+
+
+    async def __acall__(self, request):
+        token = current.set(Routing())
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.stick(request, response)
+
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        choices = replicas()
+        if (choices and request.method in SAFE_METHODS
+        and STICKY_COOKIE not in request.COOKIES
+        and getattr(view_class(view_func), 'replica_reads', False)):
+            current.get().alias = random.choice(choices)
+
+
+    def stick(self, request, response):
+        if (replicas() and request.method not in SAFE_METHODS
+        and response.status_code < 400):
+            response.set_cookie(
+            STICKY_COOKIE, '1', max_age=getattr(settings, 'SHOP_DB_STICKY_SECONDS', 10),
+            httponly=True, samesite='Lax'
+            )
+        return response
+
+
+def check_connections():
+    """
+    Persistent connections of this thread which stopped working are closed
+    before a request uses them, so it reconnects instead of failing. Only
+    connections opened by earlier requests are pinged.
+    """
+    if not getattr(settings, 'SHOP_DB_HEALTH_CHECKS', True):
+        return
+    for connection in connections.all():
+        if (connection.connection is not None
+        and not connection.in_atomic_block
+        and not connection.is_usable()):
+            connection.close()
@@ -0,0 +1,222 @@
+"""
+Ranked full-text search over Product.nazev and Product.description.
+
+Postgres keeps a tsvector per product in shop_product_search with a GIN
+index, SQLite an FTS5 table shop_product_fts. Text is normalized in
+Python (lower case, no diacritics), so "zluta" finds "žlutá" on both.
+"""
+import re
+import unicodedata
+
+from django.db import connections, router
+
+from .models import Product
+
+
+WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return text.lower()
+
+
+def terms(query):
+    return WORD.findall(normalize(query))
+
+
+class PostgresSearch:
+    table = 'shop_product_search'
+
+    def create(self, cursor):
+        cursor.execute(
+        'CREATE TABLE IF NOT EXISTS %s ('
+        'product_id integer PRIMARY KEY REFERENCES shop_product (id) '
+        'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+        'document tsvector NOT NULL)' % self.table
+        )
+        cursor.execute(
+        'CREATE INDEX IF NOT EXISTS %s_document ON %s USING GIN (document)'
+        % (self.table, self.table)
+        )
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS %s' % self.table)
+
+    def index(self, cursor, rows):
+        cursor.execute(
+        'DELETE FROM %s WHERE product_id = ANY(%%s)' % self.table,
+        [[pk for pk, nazev, description in rows]]
+        )
+        cursor.executemany(
+        'INSERT INTO %s (product_id, document) VALUES (%%s, '
+        "setweight(to_tsvector('simple', %%s), 'A') || "
+        "setweight(to_tsvector('simple', %%s), 'B'))" % self.table,
+        [
+        (pk, normalize(nazev), normalize(description))
+        for pk, nazev, description in rows
+        ]
+        )
+
+    def remove(self, cursor, ids):
+        cursor.execute(
+        'DELETE FROM %s WHERE product_id = ANY(%%s)' % self.table, [list(ids)]
+        )
+
+    def search(self, cursor, words, limit, offset):
+        # prefix match on every word
+        query = ' & '.join('%s:*' % word for word in words)
+        cursor.execute(
+        'SELECT product_id FROM %s, to_tsquery(%%s, %%s) query '
+        'WHERE document @@ query '
+        'ORDER BY ts_rank_cd(document, query) DESC, product_id '
+        'LIMIT %%s OFFSET %%s' % self.table,
+        ['simple', query, limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SqliteSearch:
+    table = 'shop_product_fts'
+
+    def create(self, cursor):
+        cursor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS %s '
+        'USING fts5(nazev, description)' % self.table
+        )
+
+    def drop(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS %s' % self.table)
+
+    def index(self, cursor, rows):
+        self.remove(cursor, [pk for pk, nazev, description in rows])
+        cursor.executemany(
+        'INSERT INTO %s (rowid, nazev, description) VALUES (%%s, %%s, %%s)'
+        % self.table,
+        [
+        (pk, normalize(nazev), normalize(description))
+        for pk, nazev, description in rows
+        ]
+        )
+
+    def remove(self, cursor, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(
+            'DELETE FROM %s WHERE rowid IN (%s)'
+            % (self.table, ', '.join(['%s'] * len(chunk))),
+            chunk
+            )
+
+    def search(self, cursor, words, limit, offset):
+        query = ' '.join('"%s"*' % word for word in words)
+        cursor.execute(
+        'SELECT rowid FROM %s WHERE %s MATCH %%s '
+        'ORDER BY bm25(%s, 10.0, 1.0), rowid LIMIT %%s OFFSET %%s'
+        % (self.table, self.table, self.table),
+        [query, limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+backends = {
+    'postgresql': PostgresSearch,
+    'sqlite': SqliteSearch,
+}
+
+
+def get_backend(connection):
+    backend = backends.get(connection.vendor)
+    return backend() if backend else None
+
+
+def index_products(ids):
+    """
+    Reindex given products, called after imports and saves.
+    """
+    ids = list(ids)
+    connection = connections[router.db_for_write(Product)]
+    backend = get_backend(connection)
+    if backend is None or not ids:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), 1000):
+            rows = list(
+            Product.objects.using(connection.alias).filter(
+            id__in=ids[start:start + 1000]
+            ).values_list('id', 'nazev', 'description')
+            )
+            if rows:
+                backend.index(cursor, rows)
+
+
+def remove_products(ids):
+    connection = connections[router.db_for_write(Product)]
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, ids)
+
+
+def rebuild(chunk_size=1000):
+    connection = connections[router.db_for_write(Product)]
+    backend = get_backend(connection)
+    if backend is None:
+        return 0
+    with connection.cursor() as cursor:
+        backend.drop(cursor)
+        backend.create(cursor)
+    products = Product.objects.using(connection.alias).order_by('id')
+    count = 0
+    last = 0
+    while True:
+        ids = list(
+        products.filter(id__gt=last).values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return count
+        index_products(ids)
+        count += len(ids)
+        last = ids[-1]
+
+
+class SearchPage:
+    """
+    Products matching the query ordered by rank.
+    """
+
+    def __init__(self, query, page=1, size=50):
+        words = terms(query)
+        self.number = max(page, 1)
+        offset = (self.number - 1) * size
+        connection = connections[router.db_for_read(Product)]
+        backend = get_backend(connection)
+
+        if not words:
+            ids = []
+        elif backend is None:
+            # no full-text index on this database, plain scan
+            queryset = Product.objects.using(connection.alias)
+            for word in words:
+                queryset = queryset.filter(nazev__icontains=word)
+            ids = list(
+            queryset.order_by('id').values_list('id', flat=True)[
+            offset:offset + size + 1
+            ]
+            )
+        else:
+            with connection.cursor() as cursor:
+                ids = backend.search(cursor, words, size + 1, offset)
+
+        self.has_next = len(ids) > size
+        ids = ids[:size]
+        products = Product.objects.using(connection.alias).in_bulk(ids)
+        self.object_list = [products[pk] for pk in ids if pk in products]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
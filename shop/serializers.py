@@ -1,7 +1,104 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import *
 
 
+class ImportRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Checks the pk against ids prefetched by BulkImportListSerializer
+    instead of running one query per value.
+    """
+
+    def to_internal_value(self, data):
+        known_ids = self.context.get('known_ids')
+        if known_ids is None:
+            return super().to_internal_value(data)
+
+        Model = self.get_queryset().model
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            pk = Model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in known_ids.get(Model, ()):
+            self.fail('does_not_exist', pk_value=data)
+        return Model(pk=pk)
+
+
+class BulkImportListSerializer(serializers.ListSerializer):
+    """
+    Validates a chunk of rows, related ids are checked with one query per
+    target model.
+
+    Invalid rows don't fail the whole list, they are left out of
+    validated_data and their errors are kept in `row_errors` by row index.
+    Ids passed in the `pending_ids` context count as existing.
+    """
+
+    def related_fields(self):
+        for name, field in self.child.fields.items():
+            many = isinstance(field, serializers.ManyRelatedField)
+            if many:
+                field = field.child_relation
+            if isinstance(field, ImportRelatedField) and not field.read_only:
+                yield name, field, many
+
+
+    def prefetch_ids(self, rows):
+        wanted = {}
+        for name, field, many in self.related_fields():
+            Model = field.get_queryset().model
+            values = wanted.setdefault(Model, set())
+            for row in rows:
+                value = row.get(name) if isinstance(row, dict) else None
+                if not many:
+                    value = [value]
+                elif isinstance(value, str) or not hasattr(value, '__iter__'):
+                    # ManyRelatedField reports it as not_a_list
+                    continue
+                for item in value:
+                    try:
+                        values.add(Model._meta.pk.to_python(item))
+                    except (TypeError, ValueError, DjangoValidationError):
+                        pass
+
+        known_ids = {}
+        pending_ids = self.context.get('pending_ids', {})
+        for Model, values in wanted.items():
+            values.discard(None)
+            known_ids[Model] = set(pending_ids.get(Model, ()))
+            values -= known_ids[Model]
+            if values:
+                known_ids[Model].update(
+                Model.objects.filter(pk__in=values).values_list('pk', flat=True)
+                )
+        return known_ids
+
+
+    def run_validation(self, data=serializers.empty):
+        if isinstance(data, list):
+            self._context['known_ids'] = self.prefetch_ids(data)
+        return super().run_validation(data)
+
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        self.row_errors = {}
+        validated = []
+        for index, item in enumerate(data):
+            try:
+                validated.append(self.child.run_validation(item))
+            except serializers.ValidationError as exc:
+                self.row_errors[index] = exc.detail
+        return validated
+
+
 class AttrNameSerializer(serializers.ModelSerializer):
     # name = serializers.CharField(source="nazev")
     # code = serializers.CharField(source='kod')
@@ -11,6 +108,7 @@ class AttrNameSerializer(serializers.ModelSerializer):
     class Meta:
         model = AttributeName
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
 
 
 class AttrValueSerializer(serializers.ModelSerializer):
@@ -18,22 +116,29 @@ class AttrValueSerializer(serializers.ModelSerializer):
     class Meta:
         model = AttributeValue
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
 
 
 class AttrSerializer(serializers.ModelSerializer):
     # name = AttrNameSerializer(many=True)
     # value = AttrValueSerializer(many=True)
 
+    serializer_related_field = ImportRelatedField
+
     class Meta:
         model = Attribute
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
 
 class ProductAttrSerializer(serializers.ModelSerializer):
     #attr = AttrSerializer(many=True)
 
+    serializer_related_field = ImportRelatedField
+
     class Meta:
         model = ProductAttributes
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
 
 
 class ImagesSerializer(serializers.ModelSerializer):
@@ -41,14 +146,18 @@ class ImagesSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
 
 
 class ProductImgSerializer(serializers.ModelSerializer):
     # img_id = ImagesSerializer(many=True)
 
+    serializer_related_field = ImportRelatedField
+
     class Meta:
         model = ProductImage
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -58,12 +167,163 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
 
 
 class CatalogSerializer(serializers.ModelSerializer):
     # products = ProductSerializer(many=True)
 
+    serializer_related_field = ImportRelatedField
+
     class Meta:
         model = Catalog
         fields = '__all__'
+        list_serializer_class = BulkImportListSerializer
         extra_kwargs = {'products': {'required': False}}
+
+
+class ProductAttrDetailSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(
+    source='attribute.nazev_atributu_id.nazev', default=None
+    )
+    code = serializers.CharField(
+    source='attribute.nazev_atributu_id.kod', default=None
+    )
+    value = serializers.CharField(
+    source='attribute.hodnota_atributu_id.hodnota', default=None
+    )
+
+    class Meta:
+        model = ProductAttributes
+        fields = ['id', 'attribute', 'name', 'code', 'value']
+
+
+class ProductImgDetailSerializer(serializers.ModelSerializer):
+    obrazek = serializers.CharField(source='obrazek_id.obrazek', default=None)
+
+    class Meta:
+        model = ProductImage
+        fields = ['id', 'nazev', 'obrazek_id', 'obrazek']
+
+
+class ProductDetailSerializer(serializers.ModelSerializer):
+    """
+    Read only product with nested attributes and images.
+    Use setup_eager_loading() on the queryset to avoid N+1 queries.
+    """
+    attrs = ProductAttrDetailSerializer(
+    source='productattributes_set', many=True, read_only=True
+    )
+    images = ProductImgDetailSerializer(
+    source='productimage_set', many=True, read_only=True
+    )
+
+    class Meta:
+        model = Product
+        fields = '__all__'
+
+    @staticmethod
+    def prefetch_lookups():
+        """
+        Lookups of the nested fields, for prefetch_related_objects() on
+        products which are already loaded.
+        """
+        return [
+        Prefetch(
+        'productattributes_set',
+        queryset=ProductAttributes.objects.select_related(
+        'attribute__nazev_atributu_id', 'attribute__hodnota_atributu_id'
+        ).order_by('id')
+        ),
+        Prefetch(
+        'productimage_set',
+        queryset=ProductImage.objects.select_related('obrazek_id').order_by('id')
+        ),
+        ]
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+        *ProductDetailSerializer.prefetch_lookups()
+        )
+
+
+class CatalogRefSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Catalog
+        fields = ['id', 'nazev']
+
+
+class ProductDocumentSerializer(ProductDetailSerializer):
+    """
+    Everything about a product, stored in ProductDocument.
+    """
+    catalogs = CatalogRefSerializer(
+    source='catalog_set', many=True, read_only=True
+    )
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = ProductDetailSerializer.setup_eager_loading(queryset)
+        return queryset.prefetch_related(
+        Prefetch('catalog_set', queryset=Catalog.objects.order_by('id'))
+        )
+
+
+class StoredDocumentSerializer(serializers.BaseSerializer):
+    """
+    Returns the stored document as it is.
+    """
+
+    def to_representation(self, instance):
+        return instance.document
+
+
+class CatalogSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = CatalogSummary
+        fields = '__all__'
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    processed_per_model = serializers.SerializerMethodField()
+    throughput = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        exclude = ['payload', 'heartbeat']
+
+    def get_processed_per_model(self, obj):
+        return {
+        model: sum(
+        counts.get(key, 0)
+        for key in ('created', 'updated', 'unchanged', 'failed')
+        )
+        for model, counts in (obj.summary or {}).items()
+        }
+
+    def get_throughput(self, obj):
+        """
+        Records per second.
+        """
+        if obj.started is None:
+            return None
+        end = obj.finished or timezone.now()
+        seconds = (end - obj.started).total_seconds()
+        return round(obj.processed / seconds, 1) if seconds > 0 else None
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Tokens carry the user claims the stateless authentication needs.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
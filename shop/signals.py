@@ -0,0 +1,231 @@
+from django.db import transaction
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+m2m_changed, post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import (
+authentication, cache, currency, documents, facets, middleware, routers,
+search, summaries
+)
+from .importer import records_imported, records_importing, transfer_dict
+from .models import *
+from .transactions import PendingIds
+
+
+def forget_hashes(Model, ids=None):
+    """
+    Records changed outside of the importer, next import must write them.
+    """
+    model = Model.__name__
+    if Model._meta.app_label != 'shop' or model not in transfer_dict:
+        return
+    hashes = RecordHash.objects.filter(model=model)
+    if ids is not None:
+        hashes = hashes.filter(record_id__in=ids)
+    hashes.delete()
+
+
+def forget_record_hash(sender, instance, **kwargs):
+    forget_hashes(sender, [instance.pk])
+
+
+def forget_referencing_hashes(sender, instance, **kwargs):
+    """
+    Rows pointing to a deleted record are set to NULL, deleted or lose a
+    many-to-many link without save(), their hashes would go stale.
+    """
+    for relation in sender._meta.related_objects:
+        Related = relation.related_model
+        if Related.__name__ not in transfer_dict:
+            continue
+        forget_hashes(Related, Related._default_manager.filter(
+        **{relation.field.name: instance.pk}
+        ).values('pk'))
+
+
+@receiver(m2m_changed)
+def forget_relation_hash(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        forget_hashes(model, pk_set)
+    else:
+        forget_hashes(type(instance), [instance.pk])
+
+
+@receiver(records_imported, sender=Product)
+def index_imported_products(sender, ids, **kwargs):
+    search.index_products(ids)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def remove_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(records_imported, sender=ProductAttributes)
+@receiver(post_save, sender=ProductAttributes)
+@receiver(post_delete, sender=ProductAttributes)
+def update_facet_links(sender, instance=None, ids=None, **kwargs):
+    ids = list(ids) if ids is not None else [instance.pk]
+    transaction.on_commit(lambda: facets.update_links(ids))
+
+
+@receiver(records_imported, sender=Attribute)
+@receiver(post_save, sender=Attribute)
+def update_facet_attributes(sender, instance=None, ids=None, **kwargs):
+    ids = list(ids) if ids is not None else [instance.pk]
+    transaction.on_commit(lambda: facets.update_attributes(ids))
+
+
+@receiver(pre_delete, sender=Product)
+@receiver(pre_delete, sender=Attribute)
+@receiver(pre_delete, sender=AttributeName)
+@receiver(pre_delete, sender=AttributeValue)
+def update_facets_on_delete(sender, instance, **kwargs):
+    """
+    Links are set to NULL by the delete, products are looked up before.
+    """
+    lookup = {
+    Product: 'product',
+    Attribute: 'attribute',
+    AttributeName: 'attribute__nazev_atributu_id',
+    AttributeValue: 'attribute__hodnota_atributu_id',
+    }[sender]
+    products = set(
+    ProductAttributes.objects.filter(**{lookup: instance.pk}).values_list(
+    'product_id', flat=True
+    )
+    )
+    if sender is Product:
+        products.add(instance.pk)
+    transaction.on_commit(lambda: facets.update_products(products))
+
+
+@receiver(post_save, sender=CurrencyRate)
+@receiver(post_delete, sender=CurrencyRate)
+def forget_currency_rates(sender, **kwargs):
+    transaction.on_commit(currency.forget_rates)
+    # every catalog price range is in CZK
+    transaction.on_commit(summaries.rebuild)
+
+
+# every model changed by a transaction is bumped once when it commits
+_changed_models = PendingIds(cache.bump_versions)
+
+
+def bump_cache_versions(models):
+    _changed_models.add(
+    Model.__name__ for Model in models if Model._meta.app_label == 'shop'
+    )
+
+
+@receiver(records_imported)
+def bump_model_version(sender, **kwargs):
+    bump_cache_versions([sender])
+
+
+@receiver(m2m_changed)
+def bump_relation_version(sender, instance, action, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_cache_versions([type(instance), model, sender])
+
+
+@receiver(records_importing)
+@receiver(records_imported)
+def rebuild_imported_documents(sender, ids, **kwargs):
+    """
+    Products are looked up before rows are overwritten too, so a moved
+    link or image also refreshes the product it was taken from.
+    """
+    documents.schedule(documents.affected_products(sender, ids))
+
+
+def rebuild_documents(sender, instance, **kwargs):
+    if instance.pk is not None:
+        documents.schedule(documents.affected_products(sender, [instance.pk]))
+
+
+@receiver(m2m_changed, sender=Catalog.products_ids.through)
+def rebuild_catalog_documents(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if reverse:
+        products = [instance.pk]
+    elif action == 'pre_clear':
+        products = documents.affected_products(Catalog, [instance.pk])
+    else:
+        products = pk_set
+    documents.schedule(products)
+
+
+@receiver(records_importing)
+@receiver(records_imported)
+def update_imported_summaries(sender, ids, **kwargs):
+    summaries.schedule(summaries.affected_catalogs(sender, ids))
+
+
+def update_summaries(sender, instance, **kwargs):
+    if instance.pk is not None:
+        summaries.schedule(summaries.affected_catalogs(sender, [instance.pk]))
+
+
+@receiver(m2m_changed, sender=Catalog.products_ids.through)
+@receiver(m2m_changed, sender=Catalog.attributes_ids.through)
+def update_catalog_summaries(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if not reverse:
+        catalogs = [instance.pk]
+    elif action == 'pre_clear':
+        catalogs = instance.catalog_set.values_list('id', flat=True)
+    else:
+        catalogs = pk_set
+    summaries.schedule(catalogs)
+
+
+@receiver(connection_created)
+def log_queries(sender, connection, **kwargs):
+    middleware.install(connection)
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    routers.check_connections()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_cached_user(sender, instance, **kwargs):
+    authentication.forget(instance)
+
+
+def connect_catalog_models(models):
+    """
+    Save and delete receivers of the catalog models. They are connected
+    per model, so internal models and many-to-many tables keep Django's
+    fast delete and their bulk deletes send no signals.
+    """
+    for Model in models:
+        for signal, receivers in [
+        (pre_save, [rebuild_documents, update_summaries]),
+        (post_save, [
+        forget_record_hash, bump_model_version, rebuild_documents,
+        update_summaries
+        ]),
+        (pre_delete, [
+        forget_referencing_hashes, rebuild_documents, update_summaries
+        ]),
+        (post_delete, [forget_record_hash, bump_model_version]),
+        ]:
+            for func in receivers:
+                signal.connect(func, sender=Model)
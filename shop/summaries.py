@@ -0,0 +1,168 @@
+"""
+Precomputed catalog aggregates.
+
+CatalogSummary holds product counts, the CZK price range and attribute
+facet counts of every catalog. Catalogs whose products, prices or
+attributes change are recomputed after the transaction commits, so the
+summary endpoint never touches the many-to-many tables.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from . import cache
+from .currency import price_in_czk
+from .documents import affected_products
+from .models import *
+from .transactions import PendingIds
+
+
+CHUNK_SIZE = 200
+
+# models whose changes show in catalog aggregates through products
+PRODUCT_MODELS = {
+    Product, ProductAttributes, Attribute, AttributeName, AttributeValue
+}
+
+
+def affected_catalogs(Model, ids):
+    ids = [pk for pk in ids if pk is not None]
+    if Model is Catalog:
+        return set(ids)
+    if Model not in PRODUCT_MODELS or not ids:
+        return set()
+    catalogs = set()
+    products = list(affected_products(Model, ids))
+    for start in range(0, len(products), CHUNK_SIZE):
+        catalogs.update(
+        Catalog.objects.filter(
+        products_ids__in=products[start:start + CHUNK_SIZE]
+        ).values_list('id', flat=True)
+        )
+    if Model is Attribute:
+        catalogs.update(
+        Catalog.objects.filter(attributes_ids__in=ids).values_list('id', flat=True)
+        )
+    return catalogs
+
+
+def product_stats(catalogs):
+    priced = Q(cena_decimal__isnull=False)
+    rows = Product.objects.filter(catalog__in=catalogs).values(
+    'catalog'
+    ).annotate(
+    product_count=Count('id'),
+    published_count=Count('id', filter=Q(is_published=True)),
+    cena_min=Min(price_in_czk(), filter=priced),
+    cena_max=Max(price_in_czk(), filter=priced),
+    ).order_by()
+    return {row.pop('catalog'): row for row in rows}
+
+
+def facet_counts(catalogs):
+    """
+    Products per attribute name and value, limited to the attributes of
+    the catalog when it lists any.
+    """
+    shown = defaultdict(set)
+    rows = Catalog.attributes_ids.through.objects.filter(
+    catalog_id__in=catalogs
+    ).values_list(
+    'catalog_id',
+    'attribute__nazev_atributu_id', 'attribute__hodnota_atributu_id'
+    )
+    for catalog, name, value in rows:
+        shown[catalog].add((name, value))
+
+    rows = ProductAttributes.objects.filter(
+    product__catalog__in=catalogs,
+    attribute__nazev_atributu_id__isnull=False,
+    attribute__hodnota_atributu_id__isnull=False,
+    ).values_list(
+    'product__catalog',
+    'attribute__nazev_atributu_id', 'attribute__hodnota_atributu_id',
+    'attribute__nazev_atributu_id__nazev', 'attribute__hodnota_atributu_id__hodnota',
+    ).annotate(count=Count('product', distinct=True)).order_by(
+    'product__catalog',
+    'attribute__nazev_atributu_id', 'attribute__hodnota_atributu_id',
+    )
+    facets = defaultdict(list)
+    for catalog, name, value, name_label, value_label, count in rows:
+        if shown[catalog] and (name, value) not in shown[catalog]:
+            continue
+        facets[catalog].append({
+        'attr': '%s:%s' % (name, value),
+        'name': name_label,
+        'value': value_label,
+        'count': count,
+        })
+    return facets
+
+
+def build(ids):
+    """
+    Recompute summaries of the given catalogs, summaries of deleted
+    catalogs are dropped.
+    """
+    ids = sorted({pk for pk in ids if pk})
+    for start in range(0, len(ids), CHUNK_SIZE):
+        requested = ids[start:start + CHUNK_SIZE]
+        chunk = list(
+        Catalog.objects.filter(id__in=requested).values_list('id', flat=True)
+        )
+        stats = product_stats(chunk)
+        facets = facet_counts(chunk)
+        now = timezone.now()
+        summaries = [
+        CatalogSummary(
+        catalog_id=pk, facets=facets.get(pk, []), updated=now,
+        **stats.get(pk, {})
+        )
+        for pk in chunk
+        ]
+        with transaction.atomic():
+            CatalogSummary.objects.filter(catalog_id__in=requested).exclude(
+            catalog_id__in=chunk
+            ).delete()
+            existing = set(
+            CatalogSummary.objects.filter(catalog_id__in=chunk).values_list(
+            'catalog_id', flat=True
+            )
+            )
+            CatalogSummary.objects.bulk_update(
+            [summary for summary in summaries if summary.catalog_id in existing],
+            [
+            'product_count', 'published_count', 'cena_min', 'cena_max',
+            'facets', 'updated'
+            ]
+            )
+            CatalogSummary.objects.bulk_create(
+            [summary for summary in summaries if summary.catalog_id not in existing]
+            )
+    return len(ids)
+
+
+def update(ids):
+    if build(ids):
+        cache.bump_versions(['CatalogSummary'])
+
+
+_scheduled = PendingIds(update)
+
+
+def schedule(ids):
+    """
+    Recompute summaries of the catalogs once the transaction commits, in
+    one go for all catalogs the transaction touched.
+    """
+    _scheduled.add(ids)
+
+
+def rebuild():
+    ids = list(Catalog.objects.order_by('id').values_list('id', flat=True))
+    CatalogSummary.objects.exclude(catalog_id__in=Catalog.objects.all()).delete()
+    build(ids)
+    cache.bump_versions(['CatalogSummary'])
+    return len(ids)
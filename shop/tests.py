@@ -1,3 +1,1098 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+import zlib
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, router, transaction
+from django.db.models.deletion import Collector
+from django.http import HttpResponse
+from django.test import (
+RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (
+cache, currency, documents, facets, jobs, profiling, signals, summaries
+)
+from .authentication import CachedJWTAuthentication
+from .checks import shared_cache
+from .concurrency import async_view
+from .facets import FacetIndex, bitmap_ids, to_bitmap
+from .importer import Importer
+from .middleware import QueryLog, accepted_encoding
+from .models import *
+from .pagination import KeysetPage, estimated_count
+from .parsers import MessagePackParser, iter_lines, iter_records
+from .renderers import MessagePackRenderer, ORJSONRenderer
+from .routers import STICKY_COOKIE, ReplicaMiddleware, check_connections
+from .search import SearchPage
+from .views import Import, ProductApi, ProductApiDetail, RecordsList
 
 # Create your tests here.
+
+class ProductApiTest(TestCase):
+
+    def create_products(self, count):
+        name = AttributeName.objects.create(nazev='Barva', kod='color')
+        for i in range(count):
+            product = Product.objects.create(nazev='Produkt %s' % i, cena='100')
+            value = AttributeValue.objects.create(hodnota='modra %s' % i)
+            attribute = Attribute.objects.create(
+            nazev_atributu_id=name, hodnota_atributu_id=value
+            )
+            ProductAttributes.objects.create(product=product, attribute=attribute)
+            image = Image.objects.create(obrazek='https://example.com/%s.jpg' % i)
+            ProductImage.objects.create(
+            product=product, obrazek_id=image, nazev='hlavni foto'
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/product/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_nested_fields(self):
+        self.create_products(1)
+        queries, data = self.count_queries()
+        product = data['results'][0]
+        self.assertEqual(product['attrs'][0]['name'], 'Barva')
+        self.assertEqual(product['attrs'][0]['code'], 'color')
+        self.assertEqual(product['attrs'][0]['value'], 'modra 0')
+        self.assertEqual(
+        product['images'][0]['obrazek'], 'https://example.com/0.jpg'
+        )
+
+    def test_query_count_is_constant(self):
+        self.create_products(2)
+        few, data = self.count_queries()
+        self.create_products(10)
+        many, data = self.count_queries()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(few, many)
+
+
+class PaginationTest(TestCase):
+
+    def setUp(self):
+        for i in range(1, 6):
+            Product.objects.create(id=i, nazev='Produkt %s' % i)
+
+    def test_cursor_pages(self):
+        ids = []
+        url = '/api/product/?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            ids += [product['id'] for product in data['results']]
+            url = data['next']
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+
+    def test_count_only_for_whole_table(self):
+        data = self.client.get('/api/product/').json()
+        self.assertEqual(data['count'], estimated_count(Product))
+        data = self.client.get('/api/product/?name=zzz').json()
+        self.assertEqual((data['count'], data['results']), (None, []))
+
+    def test_estimated_count(self):
+        self.assertEqual(estimated_count(Product), 5)
+
+    def test_keyset_page(self):
+        page = KeysetPage(Product.objects.all(), size=2)
+        self.assertEqual([product.id for product in page], [1, 2])
+        page = KeysetPage(Product.objects.all(), after=page.next, size=2)
+        self.assertEqual([product.id for product in page], [3, 4])
+        page = KeysetPage(Product.objects.all(), after=page.next, size=2)
+        self.assertEqual(([product.id for product in page], page.next), ([5], None))
+
+
+class IndexUsageTest(TestCase):
+    """
+    Query plans of the hot lookups name the index they should use.
+    """
+
+    def assertUsesIndex(self, queryset, index):
+        if connection.vendor == 'postgresql':
+            # tiny test tables are scanned otherwise
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+
+    def test_attribute_name_lookups(self):
+        self.assertUsesIndex(
+        AttributeName.objects.filter(kod='color'), 'attrname_kod_idx'
+        )
+        self.assertUsesIndex(
+        AttributeName.objects.filter(nazev='Barva'), 'attrname_nazev_idx'
+        )
+
+    def test_attribute_value_lookup(self):
+        self.assertUsesIndex(
+        AttributeValue.objects.filter(hodnota='modra'), 'attrvalue_hodnota_idx'
+        )
+
+    def test_image_lookup(self):
+        self.assertUsesIndex(
+        Image.objects.filter(obrazek='https://example.com/0.jpg'),
+        'image_obrazek_idx'
+        )
+
+    def test_product_name_lookup(self):
+        self.assertUsesIndex(
+        Product.objects.filter(nazev='Produkt 0'), 'product_nazev_idx'
+        )
+
+    def test_published_products_listing(self):
+        self.assertUsesIndex(
+        Product.objects.filter(is_published=True).order_by('id'),
+        'product_published_id_idx'
+        )
+
+
+class TypedFieldsTest(TestCase):
+
+    def test_parse_price(self):
+        self.assertEqual(parse_price('21 566,50'), Decimal('21566.50'))
+        self.assertEqual(parse_price(15), Decimal('15.00'))
+        for value in [None, '', 'zdarma', 'NaN', 'Infinity', '1e30', '1' * 20]:
+            self.assertIsNone(parse_price(value), value)
+
+    def test_parse_published(self):
+        self.assertEqual(
+        parse_published('2021-03-04'),
+        timezone.datetime(2021, 3, 4, tzinfo=timezone.utc)
+        )
+        self.assertEqual(
+        parse_published('2021-03-04T10:30:00+01:00'),
+        timezone.datetime(2021, 3, 4, 9, 30, tzinfo=timezone.utc)
+        )
+        for value in [None, '', 'vcera', '2021-13-01']:
+            self.assertIsNone(parse_published(value), value)
+
+    def test_save_and_import_fill_typed_fields(self):
+        product = Product.objects.create(nazev='Prvni', cena='1e30')
+        self.assertIsNone(product.cena_decimal)
+        Importer().run([
+        {'Product': {'id': 2, 'nazev': 'Druhy', 'cena': '1 200,5',
+        'published_on': '2021-03-04'}},
+        ])
+        product = Product.objects.get(id=2)
+        self.assertEqual(product.cena_decimal, Decimal('1200.50'))
+        self.assertEqual(product.published_at.date(), date(2021, 3, 4))
+
+    def test_price_filters_and_currency_ordering(self):
+        CurrencyRate.objects.create(mena='EUR', kurz='25')
+        # the test transaction never commits, which would forget the rates
+        currency.forget_rates()
+        Product.objects.create(id=1, nazev='Levny', cena='100', mena='CZK')
+        Product.objects.create(id=2, nazev='Euro', cena='10', mena='EUR')
+        Product.objects.create(id=3, nazev='Drahy', cena='1000', mena='CZK')
+        response = self.client.get('/api/product/?cena_min=50&cena_max=500')
+        self.assertEqual([p['id'] for p in response.json()['results']], [1])
+        response = self.client.get('/api/product/?ordering=-cena_czk')
+        self.assertEqual(
+        [p['id'] for p in response.json()['results']], [3, 2, 1]
+        )
+
+
+class ImporterTest(TestCase):
+
+    def test_counts(self):
+        records = [
+        {'Product': {'id': 1, 'nazev': 'Prvni'}},
+        {'Product': {'id': 2, 'nazev': 'Druhy'}},
+        ]
+        summary = Importer().run(records)
+        self.assertEqual(
+        (summary['Product']['created'], summary['Product']['updated']), (2, 0)
+        )
+        records[1]['Product']['nazev'] = 'Treti'
+        counts = Importer().run(records)['Product']
+        self.assertEqual(
+        (counts['created'], counts['updated'], counts['unchanged']), (0, 1, 1)
+        )
+        self.assertEqual(Product.objects.get(id=2).nazev, 'Treti')
+
+    def test_repeated_record_is_merged(self):
+        summary = Importer().run([
+        {'Product': {'id': 1, 'nazev': 'Prvni', 'cena': '10'}},
+        {'Product': {'id': 1, 'cena': '20'}},
+        ])
+        self.assertEqual(summary['Product']['created'], 1)
+        product = Product.objects.get(id=1)
+        self.assertEqual((product.nazev, product.cena), ('Prvni', '20'))
+
+    def test_invalid_rows_fail_alone(self):
+        summary = Importer().run([
+        {'Product': {'id': 'abc', 'nazev': 'Spatne'}},
+        {'Product': 5},
+        {'Product': {'id': '2', 'nazev': 'Druhy'}},
+        ])
+        counts = summary['Product']
+        self.assertEqual((counts['created'], counts['failed']), (1, 2))
+        self.assertEqual(
+        [(error['id'], list(error['errors'])) for error in counts['errors']],
+        [('abc', ['id']), (None, ['non_field_errors'])]
+        )
+        self.assertEqual(Product.objects.get(id=2).nazev, 'Druhy')
+
+    def test_sequence_is_reset(self):
+        Importer().run([{'Product': {'id': 10, 'nazev': 'Deset'}}])
+        self.assertEqual(Product.objects.create(nazev='Dalsi').id, 11)
+
+    def test_stream_commits_chunks(self):
+        records = [{'Product': {'id': i, 'nazev': str(i)}} for i in range(1, 6)]
+        chunks = []
+        summary = Importer(chunk_size=2).run_stream(iter(records), chunks.append)
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(summary['Product']['created'], 5)
+
+    def test_missing_foreign_key_fails_the_row(self):
+        summary = Importer().run([
+        {'Product': {'id': 1, 'nazev': 'Prvni'}},
+        {'ProductImage': {'id': 1, 'product': 1}},
+        {'ProductImage': {'id': 2, 'product': 99}},
+        ])
+        counts = summary['ProductImage']
+        self.assertEqual((counts['created'], counts['failed']), (1, 1))
+        self.assertEqual(counts['errors'][0]['id'], 2)
+        self.assertIn('product', counts['errors'][0]['errors'])
+
+    def test_scalar_many_to_many_fails_the_row(self):
+        summary = Importer().run([
+        {'Product': {'id': 1, 'nazev': 'Prvni'}},
+        {'Catalog': {'id': 1, 'products_ids': 5}},
+        {'Catalog': {'id': 2, 'products_ids': [1]}},
+        ])
+        counts = summary['Catalog']
+        self.assertEqual((counts['created'], counts['failed']), (1, 1))
+        self.assertEqual(
+        counts['errors'][0]['errors']['products_ids'][0].code, 'not_a_list'
+        )
+
+    def test_foreign_keys_are_checked_in_bulk(self):
+        def import_links(first, count):
+            ids = range(first, first + count)
+            records = [{'Product': {'id': i, 'nazev': str(i)}} for i in ids]
+            records += [{'ProductImage': {'id': i, 'product': i}} for i in ids]
+            with CaptureQueriesContext(connection) as queries:
+                Importer().run(records)
+            return len(queries)
+
+        self.assertEqual(import_links(1, 2), import_links(100, 20))
+
+    def test_dry_run(self):
+        Importer().run([{'Product': {'id': 1, 'nazev': 'Prvni'}}])
+        summary = Importer(dry_run=True).run([
+        {'Product': {'id': 1, 'nazev': 'Zmeneny'}},
+        {'Product': {'id': 2, 'nazev': 'Novy'}},
+        # refers to a product the same dry run would insert
+        {'ProductImage': {'id': 1, 'product': 2}},
+        {'ProductImage': {'id': 2, 'product': 99}},
+        ])
+        self.assertEqual(summary['Product']['changes'], [
+        {'id': 1, 'fields': {'nazev': ['Prvni', 'Zmeneny']}}
+        ])
+        self.assertEqual(summary['Product']['created'], 1)
+        self.assertEqual(summary['ProductImage']['created'], 1)
+        self.assertEqual(summary['ProductImage']['dangling'], [
+        {'id': 2, 'field': 'product', 'value': 99}
+        ])
+        self.assertEqual(Product.objects.get(id=1).nazev, 'Prvni')
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertFalse(ProductImage.objects.exists())
+
+
+class StreamingParserTest(SimpleTestCase):
+
+    def test_array_and_ndjson(self):
+        self.assertEqual(list(iter_records(io.BytesIO(b'[{"a": 1}, {"b": 2}]'))), [
+        {'a': 1}, {'b': 2}
+        ])
+        self.assertEqual(list(iter_records(io.BytesIO(b'{"a": 1}\n{"b": 2}\n'))), [
+        {'a': 1}, {'b': 2}
+        ])
+
+    def test_records_split_across_reads(self):
+        payload = json.dumps([{'nazev': 'x' * 1000, 'id': i} for i in range(200)])
+        records = list(iter_records(io.BytesIO(payload.encode())))
+        self.assertEqual([record['id'] for record in records], list(range(200)))
+
+    def test_malformed_record(self):
+        with self.assertRaises(ValueError):
+            list(iter_records(io.BytesIO(b'[{"a": 1}, {"b": ]')))
+        with self.assertRaises(ValueError):
+            list(iter_records(io.BytesIO(b'[{"a": 1}')))
+        with self.assertRaisesMessage(ValueError, 'line 2'):
+            list(iter_lines(io.BytesIO(b'{"a": 1}\n{"b"\n')))
+
+
+class ImportViewTest(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin'))
+
+    def put(self, body, content_type='application/json', query=''):
+        return self.client.put('/import/' + query, body, content_type=content_type)
+
+    @override_settings(SHOP_JSON_IN_MEMORY_MAX=0)
+    def test_streamed_payload(self):
+        response = self.put(json.dumps([{'Product': {'id': 1, 'nazev': 'Prvni'}}]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['Product']['created'], 1)
+
+    @override_settings(SHOP_JSON_IN_MEMORY_MAX=0)
+    def test_malformed_payload_writes_nothing(self):
+        response = self.put('[{"Product": {"id": 1, "nazev": "Prvni"}}, {"Product": ')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+    def test_ndjson_payload(self):
+        response = self.put(
+        '{"Product": {"id": 1, "nazev": "Prvni"}}\n', 'application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Product.objects.filter(id=1).exists())
+
+    def test_dry_run_writes_nothing(self):
+        response = self.put(
+        json.dumps([{'Product': {'id': 1, 'nazev': 'Prvni'}}]), query='?dry_run=1'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['Product']['created'], 1)
+        self.assertFalse(Product.objects.exists())
+
+
+class UniqueLinkTest(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(nazev='Produkt')
+        self.attribute = Attribute.objects.create()
+        ProductAttributes.objects.create(
+        id=1, product=self.product, attribute=self.attribute
+        )
+
+    def test_duplicate_link_is_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductAttributes.objects.create(
+            product=self.product, attribute=self.attribute
+            )
+
+    def test_import_reports_duplicates(self):
+        summary = Importer().run([
+        {'ProductAttributes': {
+        'id': 2, 'product': self.product.id, 'attribute': self.attribute.id
+        }},
+        ])
+        counts = summary['ProductAttributes']
+        self.assertEqual(counts['failed'], 1)
+        self.assertEqual(counts['created'], 0)
+        self.assertEqual(ProductAttributes.objects.count(), 1)
+
+    def test_import_swaps_links(self):
+        other = Attribute.objects.create()
+        ProductAttributes.objects.create(
+        id=2, product=self.product, attribute=other
+        )
+        summary = Importer().run([
+        {'ProductAttributes': {
+        'id': 1, 'product': self.product.id, 'attribute': other.id
+        }},
+        {'ProductAttributes': {
+        'id': 2, 'product': self.product.id, 'attribute': self.attribute.id
+        }},
+        ])
+        counts = summary['ProductAttributes']
+        self.assertEqual(counts['failed'], 0)
+        self.assertEqual(counts['updated'], 2)
+        self.assertEqual(
+        dict(ProductAttributes.objects.values_list('id', 'attribute_id')),
+        {1: other.id, 2: self.attribute.id}
+        )
+
+    def test_import_reuses_released_link(self):
+        other = Attribute.objects.create()
+        summary = Importer().run([
+        {'ProductAttributes': {
+        'id': 1, 'product': self.product.id, 'attribute': other.id
+        }},
+        {'ProductAttributes': {
+        'id': 2, 'product': self.product.id, 'attribute': self.attribute.id
+        }},
+        ])
+        counts = summary['ProductAttributes']
+        self.assertEqual((counts['created'], counts['updated']), (1, 1))
+
+
+class ScheduledRebuildTest(TestCase):
+
+    def hooks(self, pending):
+        return [
+        func for sids, func in connection.run_on_commit if func == pending.flush
+        ]
+
+    def test_one_rebuild_per_transaction(self):
+        with transaction.atomic():
+            Importer().run([
+            {'Product': {'id': 1, 'nazev': 'Prvni'}},
+            {'Product': {'id': 2, 'nazev': 'Druhy'}},
+            {'Catalog': {'id': 1, 'products_ids': [1, 2]}},
+            {'Image': {'id': 1, 'obrazek': 'https://example.com/1.jpg'}},
+            {'ProductImage': {'id': 1, 'product': 1, 'obrazek_id': 1}},
+            ])
+            self.assertEqual(len(self.hooks(documents._scheduled)), 1)
+            self.assertEqual(len(self.hooks(summaries._scheduled)), 1)
+            self.assertEqual(documents._scheduled.local.ids, {1, 2})
+            self.assertEqual(summaries._scheduled.local.ids, {1})
+
+    def test_rolled_back_savepoint(self):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    Product.objects.create(id=1, nazev='Prvni')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            Product.objects.create(id=2, nazev='Druhy')
+            self.assertEqual(len(self.hooks(documents._scheduled)), 1)
+            self.assertEqual(documents._scheduled.local.ids, {2})
+
+
+class RecordHashTest(TestCase):
+
+    records = [
+    {'Product': {'id': 1, 'nazev': 'Prvni'}},
+    {'Image': {'id': 1, 'obrazek': 'https://example.com/1.jpg'}},
+    {'ProductImage': {'id': 1, 'product': 1, 'obrazek_id': 1}},
+    {'Catalog': {'id': 1, 'products_ids': [1]}},
+    ]
+
+    def test_unchanged_rows_are_skipped(self):
+        Importer().run(self.records)
+        summary = Importer().run(self.records)
+        self.assertEqual(summary['Product']['unchanged'], 1)
+        self.assertEqual(summary['ProductImage']['unchanged'], 1)
+
+    def test_save_forgets_hash(self):
+        Importer().run(self.records)
+        Product.objects.filter(id=1).update(nazev='Jiny')
+        Product.objects.get(id=1).save()
+        summary = Importer().run(self.records)
+        self.assertEqual(summary['Product']['updated'], 1)
+
+    def test_delete_forgets_referencing_hashes(self):
+        Importer().run(self.records)
+        Image.objects.filter(id=1).delete()
+        Product.objects.filter(id=1).delete()
+        self.assertIsNone(ProductImage.objects.get(id=1).obrazek_id)
+        summary = Importer().run(self.records)
+        self.assertEqual(summary['ProductImage']['updated'], 1)
+        self.assertEqual(summary['Catalog']['updated'], 1)
+        self.assertEqual(ProductImage.objects.get(id=1).obrazek_id_id, 1)
+        self.assertEqual(
+        list(Catalog.objects.get(id=1).products_ids.values_list('id', flat=True)),
+        [1]
+        )
+
+    def test_internal_models_fast_delete(self):
+        for Model in [RecordHash, ImportJob, Catalog.products_ids.through]:
+            collector = Collector(using='default')
+            self.assertTrue(collector.can_fast_delete(Model.objects.all()), Model)
+        collector = Collector(using='default')
+        self.assertFalse(collector.can_fast_delete(Image.objects.all()))
+
+    def test_versions_bumped_once_per_transaction(self):
+        with transaction.atomic():
+            for i in range(5):
+                Product.objects.create(nazev=str(i))
+            Image.objects.create(obrazek='https://example.com/1.jpg')
+            hooks = [
+            func for sids, func in connection.run_on_commit
+            if func == signals._changed_models.flush
+            ]
+        self.assertEqual(len(hooks), 1)
+        with mock.patch.object(signals._changed_models, 'func') as bump:
+            hooks[0]()
+        bump.assert_called_once_with({'Product', 'Image'})
+
+
+class ImportJobTest(TestCase):
+
+    def payload(self, records):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as fh:
+            json.dump(records, fh)
+        return fh.name
+
+    def test_stale_job_is_resumed(self):
+        records = [{'Product': {'id': i, 'nazev': str(i)}} for i in range(1, 5)]
+        job = ImportJob.objects.create(
+        payload=self.payload(records), status=ImportJob.RUNNING, processed=2,
+        heartbeat=timezone.now() - timedelta(hours=1)
+        )
+        fresh = ImportJob.objects.create(
+        payload='running.json', status=ImportJob.RUNNING,
+        heartbeat=timezone.now()
+        )
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (ImportJob.DONE, 4))
+        # records before the last committed chunk are not imported again
+        self.assertEqual(
+        list(Product.objects.values_list('id', flat=True)), [3, 4]
+        )
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, ImportJob.RUNNING)
+
+    @override_settings(SHOP_IMPORT_WORKER='command')
+    def test_no_watcher_for_command_worker(self):
+        jobs.start()
+        self.assertIsNone(jobs._watcher)
+
+
+class FacetIndexTest(TestCase):
+
+    def setUp(self):
+        self.name = AttributeName.objects.create(nazev='Barva')
+        self.red = AttributeValue.objects.create(hodnota='cervena')
+        self.blue = AttributeValue.objects.create(hodnota='modra')
+        self.products = [Product.objects.create(nazev=str(i)) for i in range(3)]
+        for product, value in zip(self.products, [self.red, self.red, self.blue]):
+            self.link(product, value)
+
+    def link(self, product, value):
+        attribute = Attribute.objects.create(
+        nazev_atributu_id=self.name, hodnota_atributu_id=value
+        )
+        return ProductAttributes.objects.create(
+        product=product, attribute=attribute
+        )
+
+    def test_bitmap_round_trip(self):
+        self.assertEqual(bitmap_ids(to_bitmap([9, 0, 17, 3])), [0, 3, 9, 17])
+        self.assertEqual(to_bitmap([]), 0)
+
+    def test_build_and_update(self):
+        index = FacetIndex()
+        index.build(1)
+        red = (self.name.pk, self.red.pk)
+        blue = (self.name.pk, self.blue.pk)
+        self.assertEqual(index.counts(), {red: 2, blue: 1})
+        self.assertEqual(
+        bitmap_ids(index.select([red, blue])), [p.pk for p in self.products]
+        )
+
+        moved = self.products[0]
+        ProductAttributes.objects.filter(product=moved).delete()
+        self.link(moved, self.blue)
+        index.update_products([moved.pk])
+        self.assertEqual(index.counts(), {red: 1, blue: 2})
+        self.assertEqual(index.counts(to_bitmap([moved.pk])), {blue: 1})
+
+    def test_version_is_read_from_cache(self):
+        cache.backend().delete(facets.VERSION_KEY)
+        facets.current_version()
+        with self.assertNumQueries(0):
+            facets.current_version()
+
+    def test_page_from_stale_index_is_not_cached(self):
+        cache.backend().clear()
+        facets.facet_index()
+        # another process changed the data, the rebuild has not finished
+        cache.backend().set(facets.VERSION_KEY, facets._index.version + 1)
+        self.addCleanup(cache.backend().delete, facets.VERSION_KEY)
+        with mock.patch.object(facets, 'rebuild_in_background') as rebuild:
+            response = self.client.get('/product/')
+            self.client.get('/product/')
+        self.assertTrue(rebuild.called)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(cache.stats()['hits'], 0)
+
+
+class ExportTest(TestCase):
+
+    def test_anonymous_is_redirected_to_login(self):
+        response = self.client.get('/export/Product/')
+        self.assertRedirects(
+        response, '/login/?next=/export/Product/', fetch_redirect_response=False
+        )
+
+    def test_streams_records(self):
+        Product.objects.create(id=1, nazev='Prvni')
+        self.client.force_login(User.objects.create_user('admin'))
+        response = self.client.get('/export/Product/')
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"Prvni"', lines[0])
+
+
+class RegistryTest(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin'))
+
+    def test_catalog_models_are_listed(self):
+        self.assertEqual(self.client.get('/detail/product/').status_code, 200)
+        self.assertEqual(
+        self.client.get('/detail/catalog_products_ids/').status_code, 200
+        )
+
+    def test_internal_models_are_hidden(self):
+        ImportJob.objects.create(id=1, payload='data.json')
+        for name in ['ImportJob', 'RecordHash', 'ProductDocument', 'IndexVersion']:
+            self.assertEqual(self.client.get('/detail/%s/' % name).status_code, 404)
+            self.assertEqual(self.client.get('/export/%s/' % name).status_code, 404)
+        self.assertEqual(self.client.get('/detail/ImportJob/1/').status_code, 404)
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+
+    local = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+    }}
+    shared = {'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': '/tmp/shop-cache',
+    }}
+
+    def test_local_cache_with_workers(self):
+        with override_settings(CACHES=self.local, SHOP_WORKERS=4):
+            warnings = shared_cache(None)
+        self.assertEqual([warning.id for warning in warnings], ['shop.W001'])
+
+    def test_local_cache_with_one_worker(self):
+        with override_settings(CACHES=self.local, SHOP_WORKERS=1):
+            self.assertEqual(shared_cache(None), [])
+
+    def test_shared_cache(self):
+        with override_settings(CACHES=self.shared, SHOP_WORKERS=4):
+            self.assertEqual(shared_cache(None), [])
+
+
+class QueryLogTest(TestCase):
+
+    def test_counted_statements_are_bounded(self):
+        log = QueryLog(count_sql=True)
+        log.max_sql = 3
+        context = {'connection': connection}
+        for sql in ['a', 'b', 'a', 'c', 'd', 'e', 'a']:
+            log(lambda *args: None, sql, None, False, context)
+        self.assertEqual(log.count, 7)
+        self.assertEqual(log.statements, [])
+        self.assertEqual(log.repeated, {'a': 3, 'b': 1, 'c': 1})
+
+    @override_settings(SHOP_QUERY_ALARM=1, SHOP_VIEW_CACHE=False)
+    def test_alarm_names_repeated_query(self):
+        for i in range(3):
+            Product.objects.create(nazev=str(i))
+        with self.assertLogs('shop.metrics', 'WARNING') as logs:
+            self.client.get('/api/product/')
+        self.assertIn('queries', logs.output[0])
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        Product.objects.create(id=1, nazev='Modre tricko', description='bavlna')
+        Product.objects.create(id=2, nazev='Kalhoty', description='modre dziny')
+        Product.objects.create(id=3, nazev='Boty')
+
+    def test_ranked_matches(self):
+        self.assertEqual([p.id for p in SearchPage('modre')], [1, 2])
+        self.assertEqual([p.id for p in SearchPage('modr tri')], [1])
+        self.assertEqual([p.id for p in SearchPage('')], [])
+
+    def test_index_follows_changes(self):
+        product = Product.objects.get(id=3)
+        product.nazev = 'Modre boty'
+        product.save()
+        Product.objects.get(id=1).delete()
+        self.assertEqual([p.id for p in SearchPage('modre')], [3, 2])
+
+    def test_pages(self):
+        page = SearchPage('modre', page=1, size=1)
+        self.assertEqual(([p.id for p in page], page.has_next), ([1], True))
+        response = self.client.get('/api/product/search/', {'q': 'boty'})
+        self.assertEqual(
+        [p['id'] for p in response.json()['results']], [3]
+        )
+
+    def test_api_reads_products_once(self):
+        image = Image.objects.create(obrazek='https://example.com/1.jpg')
+        for product in Product.objects.all():
+            ProductImage.objects.create(product=product, obrazek_id=image)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/product/search/', {'q': 'modre'})
+        results = response.json()['results']
+        self.assertEqual([p['id'] for p in results], [1, 2])
+        self.assertEqual(len(results[0]['images']), 1)
+        product_queries = [
+        query for query in queries
+        if query['sql'].startswith('SELECT')
+        and 'FROM "shop_product"' in query['sql']
+        ]
+        self.assertEqual(len(product_queries), 1)
+
+
+@override_settings(SHOP_VIEW_CACHE=True)
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        cache.backend().clear()
+        Product.objects.create(id=1, nazev='Prvni')
+        self.client.force_login(User.objects.create_user('admin'))
+
+    def test_cached_until_model_changes(self):
+        self.assertContains(self.client.get('/detail/product/'), 'Prvni')
+        Product.objects.filter(id=1).update(nazev='Zmeneny')
+        self.assertContains(self.client.get('/detail/product/'), 'Prvni')
+        self.assertEqual(cache.stats()['hits'], 1)
+        cache.bump_versions(['Product'])
+        self.assertContains(self.client.get('/detail/product/'), 'Zmeneny')
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/product/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get('/api/product/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        cache.bump_versions(['Product'])
+        response = self.client.get('/api/product/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class StatsAccessTest(TestCase):
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/cache/stats/').status_code, 401)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        token = AccessToken.for_user(User.objects.get(username='admin'))
+        response = self.client.get(
+        '/cache/stats/', HTTP_AUTHORIZATION='Bearer %s' % token
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SHOP_METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(SHOP_STATS_PUBLIC=True)
+    def test_public(self):
+        for path in ['/metrics', '/cache/stats/']:
+            self.assertEqual(self.client.get(path).status_code, 200, path)
+
+
+class DocumentAndSummaryTest(TestCase):
+
+    def setUp(self):
+        cache.backend().clear()
+        CurrencyRate.objects.create(mena='EUR', kurz='25')
+        self.catalog = Catalog.objects.create(id=1)
+        self.catalog.products_ids.add(
+        Product.objects.create(id=1, nazev='Levny', cena='100', mena='CZK'),
+        Product.objects.create(
+        id=2, nazev='Drahy', cena='10', mena='EUR', is_published=True
+        ),
+        )
+
+    def test_documents(self):
+        documents.update([1, 2])
+        response = self.client.get('/api/documents/1/')
+        self.assertEqual(response.status_code, 200)
+        document = response.json()
+        self.assertEqual(document['nazev'], 'Levny')
+        self.assertEqual([c['id'] for c in document['catalogs']], [1])
+        Product.objects.filter(id=2).delete()
+        documents.update([2])
+        self.assertEqual(self.client.get('/api/documents/2/').status_code, 404)
+
+    def test_summary(self):
+        summaries.update([self.catalog.id])
+        summary = self.client.get('/api/catalog/1/summary/').json()
+        self.assertEqual(
+        (summary['product_count'], summary['published_count']), (2, 1)
+        )
+        self.assertEqual((summary['cena_min'], summary['cena_max']), ('100.00', '250.00'))
+
+
+class CachedUserTest(TestCase):
+
+    def setUp(self):
+        cache.backend().clear()
+        self.user = User.objects.create_user('api')
+        self.token = AccessToken.for_user(self.user)
+
+    def test_user_is_cached(self):
+        authentication = CachedJWTAuthentication()
+        self.assertEqual(authentication.get_user(self.token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(authentication.get_user(self.token), self.user)
+
+    def test_deactivated_user_is_forgotten(self):
+        authentication = CachedJWTAuthentication()
+        authentication.get_user(self.token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            authentication.get_user(self.token)
+
+    @override_settings(SHOP_AUTH_STATELESS=True)
+    def test_stateless_user(self):
+        with self.assertNumQueries(0):
+            user = CachedJWTAuthentication().get_user(self.token)
+        self.assertEqual(user.id, self.user.id)
+
+
+class CodecTest(TestCase):
+
+    def test_orjson_renderer(self):
+        content = ORJSONRenderer().render({'nazev': 'Žluté', 'ids': [1, 2]})
+        self.assertEqual(json.loads(content), {'nazev': 'Žluté', 'ids': [1, 2]})
+
+    @skipUnless(MessagePackRenderer.available, 'msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        data = [{'Product': {'id': 1, 'nazev': 'Prvni'}}]
+        content = MessagePackRenderer().render(data)
+        self.assertEqual(MessagePackParser().parse(io.BytesIO(content)), data)
+
+    @skipUnless(MessagePackRenderer.available, 'msgpack is not installed')
+    def test_msgpack_import(self):
+        self.client.force_login(User.objects.create_user('admin'))
+        records = MessagePackRenderer().lines([
+        {'Product': {'id': 1, 'nazev': 'Prvni'}},
+        {'Product': {'id': 2, 'nazev': 'Druhy'}},
+        ])
+        response = self.client.put(
+        '/import/', b''.join(records), content_type='application/msgpack'
+        )
+        self.assertEqual(response.json()['Product']['created'], 2)
+
+    def test_accepted_encoding(self):
+        self.assertEqual(accepted_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(accepted_encoding('gzip;q=0, identity'), None)
+        self.assertEqual(accepted_encoding(''), None)
+
+    @override_settings(SHOP_COMPRESS_MIN_SIZE=0)
+    def test_compressed_response(self):
+        Product.objects.create(nazev='Prvni')
+        response = self.client.get('/api/product/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+        json.loads(zlib.decompress(response.content, 31))['count'], 1
+        )
+
+
+@override_settings(SHOP_DB_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    """
+    Routing decisions only, no replica database is needed.
+    """
+
+    def route(self, view, method='get', cookies=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen['read'] = router.db_for_read(Product)
+            seen['auth'] = router.db_for_read(User)
+            seen['write'] = router.db_for_write(Product)
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(get_response)
+        response = middleware(request)
+        return seen, response
+
+    def test_read_views_use_replica(self):
+        seen, response = self.route(RecordsList.as_view())
+        self.assertEqual(seen, {'read': 'replica', 'auth': 'default', 'write': 'default'})
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_other_views_use_primary(self):
+        seen, response = self.route(Import.as_view())
+        self.assertEqual(seen['read'], 'default')
+
+    def test_writes_stick_to_primary(self):
+        seen, response = self.route(Import.as_view(), method='put')
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        seen, response = self.route(
+        RecordsList.as_view(), cookies={STICKY_COOKIE: '1'}
+        )
+        self.assertEqual(seen['read'], 'default')
+
+    @override_settings(SHOP_DB_REPLICAS=[])
+    def test_without_replicas(self):
+        seen, response = self.route(RecordsList.as_view())
+        self.assertEqual(seen['read'], 'default')
+        seen, response = self.route(Import.as_view(), method='put')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+# the replica database is configured by whys.test_settings
+HAS_REPLICA = 'replica' in settings.DATABASES
+
+
+@skipUnless(HAS_REPLICA, 'run with --settings=whys.test_settings')
+@override_settings(SHOP_DB_REPLICAS=['replica'], SHOP_VIEW_CACHE=False)
+class ReplicaReadsTest(TestCase):
+    """
+    The replica is a database of its own, rows show where a read went.
+    """
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        Product.objects.create(id=1, nazev='Na primarni')
+        Product(id=2, nazev='Na replice').save(using='replica')
+        self.client.force_login(User.objects.create_user('admin'))
+
+    def exported(self):
+        response = self.client.get('/export/Product/')
+        self.assertEqual(response.status_code, 200)
+        return [
+        json.loads(line)['Product']['nazev']
+        for line in b''.join(response.streaming_content).splitlines()
+        ]
+
+    def test_reads_and_writes(self):
+        self.assertEqual(self.exported(), ['Na replice'])
+        response = self.client.put(
+        '/import/', [{'Product': {'id': 3, 'nazev': 'Nova'}}],
+        content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertTrue(Product.objects.using('default').filter(id=3).exists())
+        self.assertFalse(Product.objects.using('replica').filter(id=3).exists())
+        # the client reads its own write from the primary
+        self.assertEqual(self.exported(), ['Na primarni', 'Nova'])
+        del self.client.cookies[STICKY_COOKIE]
+        self.assertEqual(self.exported(), ['Na replice'])
+
+
+class HealthCheckTest(TransactionTestCase):
+
+    def setUp(self):
+        connection.ensure_connection()
+
+    def test_usable_connection_is_kept(self):
+        with mock.patch.object(connection, 'is_usable', return_value=True) as usable:
+            with mock.patch.object(connection, 'close') as close:
+                check_connections()
+        self.assertEqual((usable.call_count, close.call_count), (1, 0))
+
+    def test_broken_connection_reconnects(self):
+        with mock.patch.object(connection, 'is_usable', return_value=False):
+            with mock.patch.object(connection, 'close', wraps=connection.close) as close:
+                check_connections()
+                self.assertEqual(Product.objects.count(), 0)
+        self.assertEqual(close.call_count, 1)
+
+    @override_settings(SHOP_DB_HEALTH_CHECKS=False)
+    def test_disabled(self):
+        with mock.patch.object(connection, 'is_usable') as usable:
+            check_connections()
+        self.assertEqual(usable.call_count, 0)
+
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(
+        SHOP_PROFILING=True, SHOP_PROFILE_DIR=self.directory, SHOP_VIEW_CACHE=False
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        Product.objects.create(id=1, nazev='Prvni')
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get('/api/product/?_profile=1')
+        name = response['X-Shop-Profile']
+        for suffix in ('.prof', '.collapsed', '.json'):
+            self.assertTrue((self.directory / (name + suffix)).is_file())
+        info = json.loads((self.directory / (name + '.json')).read_text())
+        self.assertEqual((info['status'], info['user']), (200, 'admin'))
+        self.assertEqual(
+        [profile['name'] for profile in profiling.profiles()], [name]
+        )
+
+    def test_only_explicit_true_values(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        for query in ['_profile=0', '_profile=', '_profile=no']:
+            response = self.client.get('/api/product/?' + query)
+            self.assertFalse(response.has_header('X-Shop-Profile'), query)
+        response = self.client.get('/api/product/', HTTP_X_SHOP_PROFILE='true')
+        self.assertTrue(response.has_header('X-Shop-Profile'))
+
+    def test_not_for_other_users(self):
+        self.client.force_login(User.objects.create_user('user'))
+        response = self.client.get('/api/product/?_profile=1')
+        self.assertFalse(response.has_header('X-Shop-Profile'))
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+
+@override_settings(SHOP_VIEW_CACHE=False)
+class AsyncViewTest(TransactionTestCase):
+    """
+    Async views run in pool threads with connections of their own, the
+    rows have to be committed.
+    """
+
+    def setUp(self):
+        self.create_products()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user('admin')
+
+    def create_products(self):
+        name = AttributeName.objects.create(nazev='Barva', kod='color')
+        for i in range(1, 4):
+            product = Product.objects.create(id=i, nazev='Produkt %s' % i, cena='100')
+            attribute = Attribute.objects.create(
+            nazev_atributu_id=name,
+            hodnota_atributu_id=AttributeValue.objects.create(hodnota=str(i))
+            )
+            ProductAttributes.objects.create(product=product, attribute=attribute)
+
+    def responses(self, view, path, **kwargs):
+        request = self.factory.get(path)
+        request.user = self.user
+        sync = view(request, **kwargs)
+        sync.render()
+        request = self.factory.get(path)
+        request.user = self.user
+        response = async_to_sync(async_view(view))(request, **kwargs)
+        return sync, response
+
+    def test_same_payload_as_sync_view(self):
+        for view, path, kwargs in [
+        (ProductApi.as_view(), '/api/product/?page_size=2', {}),
+        (ProductApiDetail.as_view(), '/api/product/2/', {'pk': 2}),
+        (RecordsList.as_view(), '/detail/product/', {'modelName': 'product'}),
+        ]:
+            sync, response = self.responses(view, path, **kwargs)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertTrue(response.is_rendered)
+            self.assertIn(b'Produkt 2', response.content)
+            self.assertEqual(response.content, sync.content, path)
@@ -0,0 +1,39 @@
+"""
+Work collected during a transaction and done once it commits.
+"""
+import threading
+
+from django.db import connection, transaction
+
+
+class PendingIds:
+    """
+    Ids added until the transaction commits, `func` is then called once
+    with all of them instead of once per signal.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.local = threading.local()
+
+
+    def add(self, ids):
+        ids = set(ids)
+        if not ids:
+            return
+        pending = getattr(self.local, 'ids', None)
+        if pending is not None and self.registered():
+            pending.update(ids)
+            return
+        self.local.ids = ids
+        transaction.on_commit(self.flush)
+
+
+    def registered(self):
+        # a rolled back savepoint drops the hook, the next ids start over
+        return any(func == self.flush for sids, func in connection.run_on_commit)
+
+
+    def flush(self):
+        ids, self.local.ids = self.local.ids, None
+        self.func(ids)
@@ -1,13 +1,17 @@
 from django.urls import path
 from . import views
+from .concurrency import read_view
 from rest_framework.urlpatterns import format_suffix_patterns
 from rest_framework_simplejwt import views as jwt_views
+from .serializers import UserTokenObtainPairSerializer
 
 # from .views import RecordsList, RecordDetail
 
 
 urlpatterns = [
-    path('api/token/', jwt_views.TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', jwt_views.TokenObtainPairView.as_view(
+    serializer_class=UserTokenObtainPairSerializer
+    ), name='token_obtain_pair'),
     path('api/token/refresh/', jwt_views.TokenRefreshView.as_view(), name='token_refresh'),
 
 
@@ -16,11 +20,25 @@ urlpatterns = [
     path('logout/', views.logoutUser, name='logout'),
 
     path('import/', views.Import.as_view(), name='import'),
+    path('import/jobs/', views.ImportJobSubmit.as_view(), name='import_jobs'),
+    path('import/jobs/<int:pk>/', views.ImportJobStatus.as_view(), name='import_job'),
+    path('export/<str:modelName>/', read_view(views.Export.as_view()), name='export'),
     path('detail/', views.Records.as_view(), name='detail'),
-    path('detail/<str:modelName>/', views.RecordsList.as_view(), name='detail'),
-    path('detail/<str:modelName>/<int:pk>/', views.RecordDetail.as_view()),
-    path('product/', views.ProductList.as_view(), name='product'),
-    path('product/search/', views.ProductList.as_view(), name='search'),
+    path('detail/<str:modelName>/', read_view(views.RecordsList.as_view()), name='detail'),
+    path('detail/<str:modelName>/<int:pk>/', read_view(views.RecordDetail.as_view())),
+    path('product/', read_view(views.ProductList.as_view()), name='product'),
+    path('cache/stats/', views.CacheStats.as_view(), name='cache_stats'),
+    path('metrics', views.metricsPage, name='metrics'),
+    path('profiles/', views.profileList, name='profiles'),
+    path('profiles/<str:name>', views.profileFile, name='profile_file'),
+    path('product/search/', read_view(views.ProductList.as_view()), name='search'),
+    path('api/product/', read_view(views.ProductApi.as_view()), name='product_api'),
+    path('api/product/<int:pk>/', views.ProductApiDetail.as_view(), name='product_api_detail'),
+    path('api/product/search/', read_view(views.ProductSearchApi.as_view()), name='product_api_search'),
+    path('api/product/facets/', views.ProductFacetsApi.as_view(), name='product_api_facets'),
+    path('api/catalog/<int:pk>/summary/', views.CatalogSummaryApi.as_view(), name='catalog_summary_api'),
+    path('api/documents/', views.ProductDocumentApi.as_view(), name='document_api'),
+    path('api/documents/<int:pk>/', views.ProductDocumentApiDetail.as_view(), name='document_api_detail'),
 
 
 ]
@@ -1,16 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
 
-from django.http import HttpResponse, JsonResponse, Http404
+from django.http import (
+HttpResponse, JsonResponse, Http404, StreamingHttpResponse, FileResponse
+)
 
 from django.contrib import messages
 
 from django.apps import apps
+from django.conf import settings
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-from django.db.models import Q
+from django.db import router
+from django.db.models import Q, prefetch_related_objects
 
 from django.views.generic import ListView
 
@@ -21,11 +26,28 @@ from rest_framework.response import Response
 from rest_framework.parsers import JSONParser
 from rest_framework.views import APIView
 from rest_framework.renderers import TemplateHTMLRenderer
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import BasePermission, IsAuthenticated
+from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import *
 from .serializers import *
+from . import exporter, jobs, metrics, profiling, registry
+from .cache import (
+CachedResponseMixin, ConditionalGetMixin, stats as cache_stats
+)
+from .concurrency import ThreadedIterator
+from .currency import price_in_czk
+from .facets import facet_list
 from .filters import ProductFilter
+from .importer import Importer
+from .pagination import (
+DocumentCursorPagination, IdCursorPagination, KeysetPage, estimated_count,
+page_size, parse_cursor
+)
+from .search import SearchPage
+from .parsers import StreamingJSONParser, NDJSONParser, StreamingMessagePackParser
+from .renderers import CSVRenderer, MessagePackRenderer, NDJSONRenderer
 from .forms import CreateUserForm, ProductSearchForm
 
 # Create your views here.
@@ -74,10 +96,40 @@ def logoutUser(request):
     return redirect('login')
 
 
+@staff_member_required
+def profileList(request):
+    context = {'profiles': profiling.profiles()}
+    return render(request, 'shop/profiles.html', context)
+
+
+@staff_member_required
+def profileFile(request, name):
+    path = profiling.profile_file(name)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+
+def metricsPage(request):
+    """
+    Request metrics for Prometheus, for staff users, the SHOP_METRICS_TOKEN
+    bearer token or everybody with SHOP_STATS_PUBLIC.
+    """
+    token = getattr(settings, 'SHOP_METRICS_TOKEN', None)
+    if not (StatsPermission.public() or request.user.is_staff or (
+    token and request.META.get('HTTP_AUTHORIZATION') == 'Bearer %s' % token
+    )):
+        return HttpResponse(status=403)
+    return HttpResponse(
+    metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 class Import(LoginRequiredMixin, APIView):
     """
     Import data in json.
-    Transfer_dict and for loop serve transfer name of 'model' to serializer.
+    Records are grouped by 'model' key of transfer_dict and written in bulk
+    inside one transaction, response holds counts per model.
 
     """
     login_url = '/login/'
@@ -86,37 +138,209 @@ class Import(LoginRequiredMixin, APIView):
     # template_name = 'shop/import.html'
 
 
-    def get_object(self, model, pk):
-        Model = apps.get_model('shop', model)
-        return get_object_or_404(Model, id=pk)
+    parser_classes = [StreamingJSONParser, NDJSONParser, StreamingMessagePackParser]
 
 
     def put(self, request, format=None):
-        transfer_dict = {
-        'AttributeName': AttrNameSerializer,
-        'AttributeValue': AttrValueSerializer,
-        'Attribute': AttrSerializer,
-        'ProductAttributes': ProductAttrSerializer,
-        'Image': ImagesSerializer,
-        'ProductImage': ProductImgSerializer,
-        'Product': ProductSerializer,
-        'Catalog': CatalogSerializer,
-        }
-        for i in request.data:
-            model = ''.join(i)
-            if model in transfer_dict:
-                try:
-                    line_id = self.get_object(model, i.get(model).get("id"))
-                    serializer = transfer_dict[model](line_id, data=i.get(model))
-                    if serializer.is_valid():
-                        serializer.save()
-                except:
-                    serializer = transfer_dict[model](data=i.get(model))
-                    if serializer.is_valid():
-                        serializer.save()
-
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        """
+        Payload is parsed lazily. With `?stream=1` or NDJSON body records
+        are committed in chunks, otherwise in one transaction.
+        `?dry_run=1` reports the changes without writing them.
+        """
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        importer = Importer(dry_run=dry_run)
+        streaming = (
+        request.query_params.get('stream') in ('1', 'true')
+        or request.content_type.startswith(NDJSONParser.media_type)
+        )
+        if streaming:
+            summary = importer.run_stream(request.data)
+        else:
+            summary = importer.run(request.data)
+        return Response(
+        summary, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED
+        )
+
+
+class Export(LoginRequiredMixin, APIView):
+    """
+    Stream all records of a model, NDJSON in the import shape, CSV with
+    `?format=csv` or MessagePack with `?format=msgpack`.
+    """
+    login_url = '/login/'
+    renderer_classes = [NDJSONRenderer, CSVRenderer, MessagePackRenderer]
+    replica_reads = True
+
+
+    def get(self, request, modelName, format=None):
+        info = registry.get(modelName)
+        if info is None:
+            raise Http404
+        Model = info.model
+        # rows are read after the request has left the routing middleware
+        using = router.db_for_read(Model)
+        renderer = request.accepted_renderer
+        if renderer.format == 'csv':
+            lines = renderer.lines(
+            exporter.iter_rows(Model, using=using), header=exporter.columns(Model)
+            )
+        else:
+            lines = renderer.lines(exporter.iter_records(Model, using=using))
+        if getattr(settings, 'SHOP_ASYNC_VIEWS', False):
+            # the async view returns before the rows are read
+            lines = ThreadedIterator(lines)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += '; charset=%s' % renderer.charset
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+        Model.__name__, renderer.format
+        )
+        return response
+
+
+class ImportJobSubmit(LoginRequiredMixin, APIView):
+    """
+    Store payload as an import job and return its id right away.
+    """
+    login_url = '/login/'
+
+
+    def post(self, request, format=None):
+        if request.stream is None:
+            return Response(
+            {'detail': 'Empty payload.'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        job = jobs.submit(request.stream)
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobStatus(LoginRequiredMixin, APIView):
+    """
+    Progress and result of an import job.
+    """
+    login_url = '/login/'
+
+
+    def get(self, request, pk, format=None):
+        job = get_object_or_404(ImportJob, pk=pk)
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data)
+
+
+class ProductApi(ConditionalGetMixin, generics.ListAPIView):
+    """
+    Products with nested attributes and images, a page costs a fixed
+    number of queries.
+    """
+    serializer_class = ProductDetailSerializer
+    pagination_class = IdCursorPagination
+    filterset_class = ProductFilter
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    cache_models = [
+    'Product', 'ProductAttributes', 'Attribute', 'AttributeName',
+    'AttributeValue', 'Image', 'ProductImage', 'CurrencyRate'
+    ]
+    # cena_czk converts EUR prices with the cached rate table
+    ordering_fields = ['id', 'cena_czk', 'published_at']
+    ordering = ['id']
+
+    def get_queryset(self):
+        queryset = Product.objects.annotate(cena_czk=price_in_czk())
+        return self.serializer_class.setup_eager_loading(queryset)
+
+
+class ProductApiDetail(ConditionalGetMixin, generics.RetrieveAPIView):
+    """
+    Product with nested attributes and images.
+    """
+    serializer_class = ProductDetailSerializer
+    cache_models = ProductApi.cache_models
+
+    def get_queryset(self):
+        return self.serializer_class.setup_eager_loading(Product.objects.all())
+
+
+class ProductDocumentApi(ConditionalGetMixin, generics.ListAPIView):
+    """
+    Stored product documents, one query per page.
+    """
+    queryset = ProductDocument.objects.all()
+    serializer_class = StoredDocumentSerializer
+    pagination_class = DocumentCursorPagination
+    cache_models = ['ProductDocument']
+
+
+class ProductDocumentApiDetail(ConditionalGetMixin, generics.RetrieveAPIView):
+    queryset = ProductDocument.objects.all()
+    serializer_class = StoredDocumentSerializer
+    cache_models = ['ProductDocument']
+
+
+class CatalogSummaryApi(ConditionalGetMixin, generics.RetrieveAPIView):
+    """
+    Precomputed counts, price range and facets of a catalog.
+    """
+    queryset = CatalogSummary.objects.all()
+    serializer_class = CatalogSummarySerializer
+    cache_models = ['CatalogSummary']
+
+
+class ProductFacetsApi(APIView):
+    """
+    Product counts per attribute value, within `?attr=` filter if given.
+    """
+
+    def get(self, request, format=None):
+        filter = ProductFilter(request.query_params, queryset=Product.objects.none())
+        return Response(facet_list(filter.selected_bitmap()))
+
+
+class ProductSearchApi(APIView):
+    """
+    Full-text search over product name and description, ranked.
+    `?q=` query, `?page=` page number.
+    """
+
+    def get(self, request, format=None):
+        results = SearchPage(
+        request.query_params.get('q', ''),
+        parse_cursor(request.query_params.get('page')) or 1,
+        page_size()
+        )
+        prefetch_related_objects(
+        results.object_list, *ProductDetailSerializer.prefetch_lookups()
+        )
+        serializer = ProductDetailSerializer(results.object_list, many=True)
+        return Response({
+        'page': results.number,
+        'has_next': results.has_next,
+        'results': serializer.data,
+        })
+
+
+class StatsPermission(BasePermission):
+    """
+    Staff users, everybody with SHOP_STATS_PUBLIC.
+    """
+
+    @staticmethod
+    def public():
+        return getattr(settings, 'SHOP_STATS_PUBLIC', False)
+
+    def has_permission(self, request, view):
+        return self.public() or request.user.is_staff
+
+
+class CacheStats(APIView):
+    """
+    Hit and miss counters of the response cache.
+    """
+    permission_classes = [StatsPermission]
+
+    def get(self, request, format=None):
+        return Response(cache_stats())
 
 
 class Records(generics.ListAPIView):
@@ -125,68 +349,83 @@ class Records(generics.ListAPIView):
     """
     renderer_classes = [TemplateHTMLRenderer]
     template_name = 'shop/detail.html'
+    replica_reads = True
 
 
     def get(self, request):
-            models = apps.all_models['shop']
-            return Response({'models': models})
+            return Response({'models': registry.models})
 
 
-class RecordsList(generics.ListAPIView):
+class RecordsList(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
     """
     Get list of records according model through url <modelName>.
     """
     renderer_classes = [TemplateHTMLRenderer]
     template_name = 'shop/detail.html'
+    replica_reads = True
 
+    def get_cache_models(self, request, modelName, **kwargs):
+        info = registry.get(modelName)
+        return [info.name] if info else []
 
-    def get(self, request, modelName):
-        models = apps.all_models['shop']
-        Model = apps.get_model('shop', modelName)
-        try:
-            model = Model.objects.all()
 
-            context = {
-            'models': models,
-            'model': model
-            }
-            return Response(context)
-        except Model.DoesNotExist:
+    def get(self, request, modelName):
+        info = registry.get(modelName)
+        if info is None:
             raise Http404
+        page = KeysetPage(info.list_queryset(), request.GET.get('after'))
+
+        context = {
+        'models': registry.models,
+        'model': page,
+        'next_query': page.next_query(request),
+        'total': estimated_count(info.model),
+        }
+        return Response(context)
 
 
-class RecordDetail(generics.ListAPIView): #DetailView?
+class RecordDetail(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView): #DetailView?
     """
     Get detail for record.
     """
     renderer_classes = [TemplateHTMLRenderer]
     template_name = 'shop/detail.html'
+    replica_reads = True
+
+    def get_cache_models(self, request, modelName, **kwargs):
+        info = registry.get(modelName)
+        return info.detail_models if info else []
 
 
     def get(self, request, modelName, pk):
-        models = apps.all_models['shop']
-        Model = apps.get_model('shop', modelName)
+        info = registry.get(modelName)
+        if info is None:
+            raise Http404
         try:
-            all_fields = Model()._meta.fields
-            record = Model.objects.get(id=pk)
-
-            context = {
-            'models': models,
-            'record': record,
-            'all_fields': all_fields,
-
-            }
-            return Response(context)
-        except Model.DoesNotExist:
+            record = info.detail_queryset().get(pk=pk)
+        except info.model.DoesNotExist:
             raise Http404
 
+        context = {
+        'models': registry.models,
+        'record': record,
+        'all_fields': info.fields,
+        'values': info.values(record),
+        }
+        return Response(context)
+
 
-class ProductList(generics.ListAPIView):
+class ProductList(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
     """
     Get list of products.
     """
     renderer_classes = [TemplateHTMLRenderer]
     template_name = 'shop/product.html'
+    replica_reads = True
+    cache_models = [
+    'Product', 'ProductAttributes', 'Attribute', 'AttributeName',
+    'AttributeValue'
+    ]
 
     def get(self, request):
 
@@ -194,16 +433,18 @@ class ProductList(generics.ListAPIView):
         form = ProductSearchForm()
         q = ''
         results = []
-        query = Q()
+        search_next = None
         if 'q' in request.GET:
             form = ProductSearchForm(request.GET)
             if form.is_valid():
                 q = form.cleaned_data['q']
-                if q is not None:
-                    query &= Q(name__contains=q)
-
-
-                results = Product.objects.filter(query)
+                results = SearchPage(
+                q, parse_cursor(request.GET.get('page')) or 1, page_size()
+                )
+                if results.has_next:
+                    params = request.GET.copy()
+                    params['page'] = results.number + 1
+                    search_next = params.urlencode()
 
         #filtering
 
@@ -212,14 +453,21 @@ class ProductList(generics.ListAPIView):
         try:
             products = Product.objects.all()
             filter = ProductFilter(request.GET, queryset=products)
-            product = filter.qs
+            page = KeysetPage(filter.qs, request.GET.get('after'))
+
+            # estimate is for the whole table, filtered lists show no total
+            filtered = any(request.GET.get(name) for name in filter.filters)
 
             context = {
             'form': form,
             'q': q,
             'results': results,
-            'products': products,
-            'filter': filter
+            'search_next': search_next,
+            'products': page,
+            'next_query': page.next_query(request),
+            'total': None if filtered else estimated_count(Product),
+            'filter': filter,
+            'facets': facet_list(filter.selected_bitmap()),
             }
             return Response(context)
         except Product.DoesNotExist:
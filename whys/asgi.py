@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'whys.settings')
+# catalog read views run async, their queries in a thread pool
+os.environ.setdefault('SHOP_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# queued and interrupted import jobs of the in-process worker
+from shop import jobs
+jobs.start()
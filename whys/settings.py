@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,10 +47,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.MetricsMiddleware',
+    'shop.middleware.CompressionMiddleware',
+    'shop.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,9 +90,46 @@ DATABASES = {
         'USER': 'postgres',
         'PASSWORD': 'postgres',
         'HOST': 'localhost',
-        'PORT': '5432'    }
+        'PORT': '5432',
+        # persistent connections, one per thread, checked before reuse;
+        # behind PgBouncer in transaction mode set DISABLE_SERVER_SIDE_CURSORS
+        'CONN_MAX_AGE': 60,
+    }
 }
 
+# Read replicas of default, SHOP_DB_REPLICAS=host[:port],...
+for index, replica in enumerate(
+    filter(None, os.environ.get('SHOP_DB_REPLICAS', '').split(',')), 1
+):
+    host, _, port = replica.partition(':')
+    DATABASES['replica%s' % index] = dict(
+        DATABASES['default'], HOST=host, PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['shop.routers.ReplicaRouter']
+SHOP_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+SHOP_DB_STICKY_SECONDS = 10  # reads after a write stay on the primary
+SHOP_DB_HEALTH_CHECKS = True  # ping persistent connections before a request
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Shared by all workers in production, e.g.
+# 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION
+# directory or a Redis store through django-redis. The process-local
+# default only suits a single process, check shop.W001 warns when it is
+# used with more SHOP_WORKERS.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shop',
+    }
+}
+
+SHOP_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))  # server processes
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -133,9 +175,82 @@ MEDIA_URL = '/img/'
 # DRF
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'shop.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+    # orjson and msgpack are optional, see shop/renderers.py
+    'DEFAULT_RENDERER_CLASSES': [
+        'shop.renderers.ORJSONRenderer',
+        'shop.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'shop.parsers.ORJSONParser',
+        'shop.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'shop.negotiation.AvailableContentNegotiation',
 }
+
+
+# API users from JWT, see shop/authentication.py
+SHOP_AUTH_CACHE_TIMEOUT = 60  # seconds a user is cached, 0 turns it off
+SHOP_AUTH_STATELESS = False  # users from token claims, no query at all
+
+
+# Import
+SHOP_IMPORT_BATCH_SIZE = 1000  # rows per bulk query
+SHOP_IMPORT_CHUNK_SIZE = 5000  # records per transaction when streaming
+SHOP_IMPORT_MAX_ERRORS = 100  # row errors kept in the summary per model
+SHOP_IMPORT_JOB_DIR = BASE_DIR / 'import_jobs'  # stored job payloads
+SHOP_IMPORT_WORKER = 'inprocess'  # or 'command' for manage.py import_worker
+SHOP_IMPORT_WORKERS = 2
+SHOP_IMPORT_JOB_TIMEOUT = 600  # seconds without heartbeat before a job is resumed
+SHOP_IMPORT_JOB_POLL = 60  # seconds between looks for stale jobs of the in-process worker
+SHOP_JSON_IN_MEMORY_MAX = 16 * 1024 * 1024  # smaller JSON imports are parsed at once
+
+
+# Export
+SHOP_EXPORT_CHUNK_SIZE = 2000  # rows fetched from the cursor at once
+
+
+# Response compression, br needs the brotli package
+SHOP_COMPRESS_TYPES = [
+    'application/json', 'application/x-ndjson', 'application/msgpack',
+    'text/csv', 'text/plain',
+]
+SHOP_COMPRESS_MIN_SIZE = 1024  # bytes, streamed responses are always compressed
+SHOP_BROTLI_QUALITY = 5
+
+
+# Listing
+SHOP_PAGE_SIZE = 50
+SHOP_ESTIMATED_COUNT_MIN = 100000  # smaller tables are counted exactly
+
+
+# Response cache of catalog views
+SHOP_VIEW_CACHE = True
+SHOP_CACHE_ALIAS = 'default'
+SHOP_VIEW_CACHE_TIMEOUT = 3600
+
+
+# Async read views, whys/asgi.py turns them on
+SHOP_ASYNC_VIEWS = os.environ.get('SHOP_ASYNC_VIEWS') == '1'
+SHOP_ASYNC_THREADS = 10  # threads, and database connections, per process
+
+
+# Request metrics at /metrics
+SHOP_QUERY_ALARM = 50  # log requests with more queries, None turns it off
+SHOP_METRICS_TOKEN = None  # bearer token that opens /metrics if set
+# /metrics and /cache/stats/ for everybody, otherwise staff users only
+SHOP_STATS_PUBLIC = False
+
+
+# Profiles of single requests, staff asks with X-Shop-Profile: 1 or ?_profile=1
+SHOP_PROFILING = False
+SHOP_PROFILE_DIR = BASE_DIR / 'profiles'
+SHOP_PROFILE_INTERVAL = 0.005  # seconds between stack samples
+SHOP_PROFILE_KEEP = 100
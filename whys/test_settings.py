@@ -0,0 +1,11 @@
+"""
+Settings for the tests, `python manage.py test --settings=whys.test_settings`.
+"""
+from .settings import *
+
+
+# shop.tests reads from a test database of its own standing in for a
+# replica, it is not one of SHOP_DB_REPLICAS
+DATABASES['replica'] = dict(
+    DATABASES['default'], TEST={'NAME': 'test_shop_replica'},
+)
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'whys.settings')
 
 application = get_wsgi_application()
+
+# queued and interrupted import jobs of the in-process worker
+from shop import jobs
+jobs.start()